@@ -1,188 +1,130 @@
+import argparse
 import atexit
 import json
 import logging
 import os
 import sys
-import threading
 import time
-import traceback
 from functools import partial
-from typing import Optional
 
-import zmq
 from PySide2 import QtCore, QtWidgets
-from PySide2.QtCore import QObject, Qt, Signal, Slot
-from zmq.sugar.socket import Socket
+from PySide2.QtCore import Qt
 
-from block import Block
-from chain import Blockchain
 from key import BitcoinAccount
+from keystore import KeyStore
+from metrics import dump_periodically, metrics, serve
+from mining import WorkServer
+from models import ChainModel, PendingUpdates, TransactionPoolModel
+from node import Node
+from template import BlockTemplateBuilder
 from transaction import Transaction
 
 logger = logging.getLogger()
 
-# wallet generation
-wallet = BitcoinAccount()
-address = wallet.to_address()
-file_name = "wallets/" + address + ".json"
-wallet.to_file(file_name)
-
 #  blockchain data
 
 difficulty = 3
-blockchain: Optional[Blockchain] = None
-peers = set()
+template_builder = BlockTemplateBuilder(
+    max_transactions=1000, max_bytes=1_000_000
+)
 
 # list_ports = ["5556", "5557", "5558"]
 
-port_bind = "5000"
-if len(sys.argv) > 1:
-    port_bind = sys.argv[1]
-
-context = zmq.Context()
-socket: Socket = context.socket(zmq.PUB)
-
-socket.bind("tcp://*:%s" % port_bind)
-
-topic = ""
-ip = "localhost" + ":" + port_bind
-socket_sub: Socket = context.socket(zmq.SUB)
-for elem in list(peers):
-    if elem != ip:
-        socket_sub.connect("tcp://%s" % elem)
-socket_sub.setsockopt_string(zmq.SUBSCRIBE, topic)
-
-
-class Connection(QObject):
-    write_block = Signal(Block)
-    write_transaction = Signal(Transaction)
-
-
-ConnectionWrite = Connection()
-
-
-def reading_network():
-    global blockchain
-
-    while True:
-        try:
-            data = socket_sub.recv_json()
-            if "operation" in data:
-                parameters = data["parameters"]
-                if data["operation"] == "add_transaction":
-                    add_transaction(parameters)
-                elif data["operation"] == "add_peer":
-                    add_peer(Blockchain.from_dict(parameters["blockchain"]))
-                elif data["operation"] == "consensus":
-                    if blockchain is not None:
-                        socket.send_json(
-                            {
-                                "operation": "consensus_resp",
-                                "parameters": {
-                                    "blockchain": blockchain.to_dict()
-                                },
-                            }
-                        )
-                elif data["operation"] == "consensus_resp":
-                    peer_blockchain = Blockchain.from_dict(
-                        parameters["blockchain"]
-                    )
-                    if blockchain is None or (
-                        len(peer_blockchain) > len(blockchain)
-                        and peer_blockchain.is_valid()
-                    ):
-                        blockchain = peer_blockchain
-                        socket.send_json(
-                            {
-                                "operation": "consensus_resp",
-                                "parameters": {
-                                    "blockchain": blockchain.to_dict()
-                                },
-                            }
-                        )
-                elif data["operation"] == "add_block":
-                    add_block(parameters)
-
-        except:
-            traceback.print_exc()
-
-
-def add_block(parameters):
-    new_block = Block.from_dict(parameters["block"])
-    if blockchain is None:
-        socket.send_json(
-            {
-                "operation": "consensus",
-                "parameters": None,
-            }
-        )
-        return
-
-    if new_block not in blockchain.blocks:
-        if not new_block.verify():
-            logging.warning("Block REJECTED: Basic verification failed.")
-            logging.warning(f"Block was {new_block}.")
-            return
-        result = blockchain.add_block_from_peer(new_block)
-        ConnectionWrite.write_block.emit(blockchain.head)
-
-        if not result:
-            logging.warning("A block from peer was discarded.")
-        else:
-            logging.warning(f"A block from peer was added: {result}")
-            socket.send_json(
-                {
-                    "operation": "add_block",
-                    "parameters": {"block": parameters["block"]},
-                }
-            )
-
-
-def add_transaction(parameters):
-    new_transaction = Transaction.from_dict(parameters["transaction"])
-    if (
-        new_transaction.sender != "NETTWORK_ADMIN"
-        and not new_transaction.verify()
-    ):
-        logging.warning("Transaction REJECTED: Basic verification failed.")
-        logging.warning(f"Transaction was {new_transaction}.")
-        return
-    if blockchain is not None and new_transaction.signature not in map(
-        lambda x: x.signature, blockchain.tx_pool
-    ):
-        blockchain.add_transaction(transaction=new_transaction)
-        socket.send_json(
-            {
-                "operation": "add_transaction",
-                "parameters": {
-                    "transaction": parameters["transaction"],
-                },
-            }
-        )
-        ConnectionWrite.write_transaction.emit(new_transaction)
-
-
-def add_peer(new_blockchain: Blockchain):
-    global blockchain
-
-    if blockchain is None or len(new_blockchain) >= len(
-        blockchain
-    ):  # Pseudo-consensus
-        validated_blockchain = Blockchain(difficulty)
-        for block in new_blockchain.blocks:
-            if block.index != 0:
-                added = validated_blockchain.add_block_from_peer(block)
-                if not added:
-                    logging.error("Bad blockchain. No peer added.")
-                    return
-            else:
-                validated_blockchain.blocks[0] = block
-
-        if not validated_blockchain.is_valid():
-            logging.error("Bad blockchain. No peer added.")
-            return
-
-        blockchain = validated_blockchain
+parser = argparse.ArgumentParser()
+parser.add_argument("port", nargs="?", default="5000")
+parser.add_argument(
+    "--host",
+    default="localhost",
+    help="host or IP address the peers reach this node at",
+)
+parser.add_argument(
+    "--metrics-endpoint",
+    help="serve metrics on a ZeroMQ REP socket, e.g. tcp://127.0.0.1:6000",
+)
+parser.add_argument(
+    "--metrics-dump",
+    type=float,
+    metavar="SECONDS",
+    help="log a metrics snapshot every SECONDS",
+)
+parser.add_argument(
+    "--consensus-timeout",
+    type=float,
+    default=2.0,
+    metavar="SECONDS",
+    help="longest wait for consensus answers after mining",
+)
+parser.add_argument(
+    "--consensus-quorum",
+    type=int,
+    help="answers needed to end a consensus round (default: all peers)",
+)
+parser.add_argument(
+    "--inv-interval",
+    type=float,
+    default=0.1,
+    metavar="SECONDS",
+    help="announce new transactions every SECONDS, 0 relays full bodies",
+)
+parser.add_argument(
+    "--inv-batch-size",
+    type=int,
+    default=500,
+    help="most transaction ids in one announcement",
+)
+parser.add_argument(
+    "--full-blocks",
+    action="store_true",
+    help="relay blocks with every transaction instead of short ids",
+)
+parser.add_argument(
+    "--index",
+    action="store_true",
+    help="index transactions by id and by address",
+)
+parser.add_argument(
+    "--prune",
+    type=int,
+    metavar="DEPTH",
+    help="keep the transactions of the last DEPTH blocks only",
+)
+parser.add_argument(
+    "--validation-workers",
+    type=int,
+    metavar="N",
+    help="validate chains from peers over N processes",
+)
+parser.add_argument(
+    "--work-endpoint",
+    metavar="ENDPOINT",
+    help="serve mining work to miner.py on ENDPOINT, e.g. tcp://*:5600",
+)
+parser.add_argument(
+    "--work-notify-endpoint",
+    default="tcp://*:5601",
+    metavar="ENDPOINT",
+    help="publish the new block templates on ENDPOINT",
+)
+parser.add_argument(
+    "--bootstrap",
+    metavar="PEER",
+    help="start from the snapshot of PEER, e.g. 192.168.1.10:5000",
+)
+parser.add_argument(
+    "--trusted-signer",
+    action="append",
+    metavar="ADDRESS",
+    help="only import snapshots signed by ADDRESS, can be repeated",
+)
+parser.add_argument(
+    "--keystore",
+    metavar="PATH",
+    help="use the first key of this keystore instead of a new wallet",
+)
+
+# the network threads only queue updates, the UI applies them at most once
+# per UI_REFRESH_INTERVAL milliseconds
+UI_REFRESH_INTERVAL = 50
 
 
 class Chain_Dialog(QtWidgets.QDialog):
@@ -190,23 +132,60 @@ class Chain_Dialog(QtWidgets.QDialog):
         super().__init__(parent)
         self.setWindowTitle("Chain")
 
-        chain_layout = QtWidgets.QFormLayout()
+        chain_layout = QtWidgets.QVBoxLayout()
+
+        self.model = ChainModel(node.blockchain, self)
 
-        chain_label = QtWidgets.QLabel(
-            json.dumps(blockchain.to_dict(), indent=4, sort_keys=True)
+        # only the visible rows are rendered, block details are serialized
+        # when a row is selected
+        self.chain_view = QtWidgets.QTreeView()
+        self.chain_view.setUniformRowHeights(True)
+        self.chain_view.setModel(self.model)
+        self.chain_view.selectionModel().currentChanged.connect(
+            self.show_details
         )
-        chain_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
 
-        self.scrollArea = QtWidgets.QScrollArea()
-        self.scrollArea.setWidgetResizable(True)
+        self.block_details = QtWidgets.QPlainTextEdit()
+        self.block_details.setReadOnly(True)
 
-        self.scrollArea.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
-        self.scrollArea.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
-        self.scrollArea.setWidget(chain_label)
-        self.scrollArea.setWidgetResizable(True)
+        self.height_value = QtWidgets.QSpinBox()
+        self.height_value.setRange(0, max(node.blockchain.head.index, 0))
+        self.button_height = QtWidgets.QPushButton("Go to height")
+        self.button_height.clicked.connect(self.jump_to_height)
 
-        chain_layout.addWidget(self.scrollArea)
+        self.hash_value = QtWidgets.QLineEdit()
+        self.button_hash = QtWidgets.QPushButton("Go to hash")
+        self.button_hash.clicked.connect(self.jump_to_hash)
+
+        layout_jump = QtWidgets.QHBoxLayout()
+        layout_jump.addWidget(self.height_value)
+        layout_jump.addWidget(self.button_height)
+        layout_jump.addWidget(self.hash_value)
+        layout_jump.addWidget(self.button_hash)
+
+        chain_layout.addLayout(layout_jump)
+        chain_layout.addWidget(self.chain_view)
+        chain_layout.addWidget(self.block_details)
         self.setLayout(chain_layout)
+        self.resize(800, 600)
+
+    def show_details(self, current, previous):
+        self.block_details.setPlainText(self.model.details(current))
+
+    def jump_to(self, index):
+        if not index.isValid():
+            QtWidgets.QMessageBox.warning(
+                self, "Not found", "No such block in the chain."
+            )
+            return
+        self.chain_view.setCurrentIndex(index)
+        self.chain_view.scrollTo(index)
+
+    def jump_to_height(self):
+        self.jump_to(self.model.index_of_height(self.height_value.value()))
+
+    def jump_to_hash(self):
+        self.jump_to(self.model.index_of_hash(self.hash_value.text().strip()))
 
 
 class Tx_Dialog(QtWidgets.QDialog):
@@ -254,16 +233,7 @@ class Tx_Dialog(QtWidgets.QDialog):
             time.time(),
         )
         transaction.sign(wallet)
-        blockchain.add_transaction(transaction)
-        ConnectionWrite.write_transaction.emit(transaction)
-        socket.send_json(
-            {
-                "operation": "add_transaction",
-                "parameters": {
-                    "transaction": transaction.to_dict(),
-                },
-            }
-        )
+        node.submit_transaction(transaction)
         self.accept()
 
 
@@ -306,16 +276,7 @@ class Peer_Dialog(QtWidgets.QDialog):
 
     def working_click(self):
         # TODO: add send tx to other peers function here
-        if blockchain != None:
-            socket.send_json(
-                {
-                    "operation": "add_peer",
-                    "parameters": {
-                        "address": address,
-                        "blockchain": blockchain.to_dict(),
-                    },
-                }
-            )
+        node.announce()
         self.accept()
 
 
@@ -323,15 +284,13 @@ class MyWidget(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
 
-        global ConnectionWrite
-
         self.text_address = QtWidgets.QLabel("My address: ")
         self.address_value = QtWidgets.QLabel(address)
         self.address_value.setTextInteractionFlags(
             QtCore.Qt.TextSelectableByMouse
         )
         self.text_ip = QtWidgets.QLabel("My IP: ")
-        self.ip_value = QtWidgets.QLabel(ip)
+        self.ip_value = QtWidgets.QLabel(node.address)
         self.ip_value.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
 
         self.button_tx = QtWidgets.QPushButton("Send transaction")
@@ -370,7 +329,10 @@ class MyWidget(QtWidgets.QWidget):
 
         self.layout.addWidget(self.text_peerlist)
         self.peers_layout = QtWidgets.QFormLayout()
-        self.tx_layout = QtWidgets.QFormLayout()
+        self.tx_model = TransactionPoolModel()
+        self.tx_view = QtWidgets.QListView()
+        self.tx_view.setUniformItemSizes(True)
+        self.tx_view.setModel(self.tx_model)
         self.block_data = QtWidgets.QLabel()
         self.block_data.setTextInteractionFlags(
             QtCore.Qt.TextSelectableByMouse
@@ -378,7 +340,7 @@ class MyWidget(QtWidgets.QWidget):
 
         self.layout.addLayout(self.peers_layout)
         self.layout.addWidget(self.text_pending)
-        self.layout.addLayout(self.tx_layout)
+        self.layout.addWidget(self.tx_view)
         self.layout.addWidget(self.text_block)
         self.layout.addWidget(self.block_data)
 
@@ -389,11 +351,12 @@ class MyWidget(QtWidgets.QWidget):
         self.button_mine.clicked.connect(self.mine_call)
         self.button_peer.clicked.connect(self.add_peer)
 
-        ConnectionWrite.write_block.connect(self.define_block_from_thread)
-        ConnectionWrite.write_transaction.connect(self.define_tx_from_thread)
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(UI_REFRESH_INTERVAL)
 
     def print_chain(self):
-        if blockchain:
+        if node.blockchain:
             chain_window = Chain_Dialog()
             chain_window.exec_()
 
@@ -409,61 +372,37 @@ class MyWidget(QtWidgets.QWidget):
             msg.exec_()
 
     def mine_call(self):
-        global blockchain
-
-        if blockchain is None:
-            self.consensus()
-            if blockchain is None:
-                blockchain = Blockchain.create(difficulty, wallet)
-        else:
-            result = blockchain.mine_block(wallet)
-            if not result:
-                logging.info("No transaction to mine")
-            else:
-                chain_length = len(blockchain.blocks)
-                self.consensus()
-                if chain_length == len(blockchain.blocks):
-                    socket.send_json(
-                        {
-                            "operation": "add_block",
-                            "parameters": {
-                                "block": blockchain.head.to_dict(),
-                            },
-                        }
-                    )
-        logging.info(f"HEAD: {blockchain.head}")
-        self.define_block(blockchain.head)
-
-    @staticmethod
-    def consensus():
-        socket.send_json(
-            {
-                "operation": "consensus",
-                "parameters": None,
-            }
+        # the UI is refreshed through the node callbacks once the
+        # consensus round is over
+        node.mine().add_done_callback(
+            lambda _: logging.info(f"HEAD: {node.blockchain.head}")
         )
-        time.sleep(2)
 
-    @Slot(Block)
-    def define_block_from_thread(self, block: Block):
-        self.define_block(block)
-
-    @Slot(Transaction)
-    def define_tx_from_thread(self, transaction: Transaction):
-        self.define_tx(transaction)
+    def refresh(self):
+        block, transactions = updates.drain()
+        if block is not None:
+            self.define_block(block)
+        elif transactions:
+            self.tx_model.append(transactions)
+        else:
+            return
+        if node.blockchain is not None:
+            self.text_pending.setText(
+                f"Pending tx: {len(node.blockchain.tx_pool)}"
+            )
 
     def define_block(self, block):
         self.block_data.setText(
             json.dumps(block.to_dict(), sort_keys=True, indent=2)
         )
-        for _ in range(self.tx_layout.rowCount()):
-            self.tx_layout.removeRow(0)
+        # transactions left out of the block stay pending
+        if node.blockchain is not None:
+            self.tx_model.reset(node.blockchain.tx_pool)
 
     @staticmethod
     def send_tx():
-        global blockchain
         # open the tx dialog window
-        if blockchain:
+        if node.blockchain:
             tx_window = Tx_Dialog()
             tx_window.exec_()
         else:
@@ -477,12 +416,6 @@ class MyWidget(QtWidgets.QWidget):
 
             msg.exec_()
 
-    def define_tx(self, transaction: Transaction):
-        text = json.dumps(transaction.to_dict(), sort_keys=True, indent=2)
-        text_tx = QtWidgets.QLabel(text)
-        text_tx.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
-        self.tx_layout.addRow(text_tx)
-
     def define_peer(self, elem):
         text_peer = QtWidgets.QLabel(elem)
         text_peer.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
@@ -494,38 +427,88 @@ class MyWidget(QtWidgets.QWidget):
         self.peers_layout.addRow(text_peer, button_peer)
 
     def add_peer(self):
-        global ip
         peer_window = Peer_Dialog()
         ret_val = peer_window.exec_()
         if ret_val == 1:
             peer_address = peer_window.get_peer()
-            if peer_address != ip:
-                peers.add(peer_address)
-                socket_sub.connect("tcp://%s" % peer_address)
+            if peer_address != node.address:
+                node.connect(peer_address)
+                node.sync_from(peer_address)
                 self.define_peer(peer_address)
 
     def remove_peer(self, elem, text_peer, button_peer):
-        peers.remove(elem)
-        socket_sub.disconnect("tcp://%s" % elem)
+        node.disconnect(elem)
 
         button_peer.deleteLater()
         text_peer.deleteLater()
 
 
 def clean_file():
-    os.remove(file_name)
-
+    if file_name is not None:
+        os.remove(file_name)
 
-atexit.register(clean_file)
 
 if __name__ == "__main__":
-    t = threading.Thread(target=reading_network)
-    t.daemon = True  #  to close when main loop close
-    t.start()
+    # the validation workers are spawned and import this module again:
+    # only the main process parses the options and starts the node
+    args = parser.parse_args()
+
+    # wallet generation
+    if args.keystore:
+        keystore = KeyStore(args.keystore)
+        if not len(keystore):
+            keystore.generate(1)
+        address = next(iter(keystore))
+        wallet = keystore.get(address)
+        file_name = None
+    else:
+        wallet = BitcoinAccount()
+        address = wallet.to_address()
+        file_name = "wallets/" + address + ".json"
+        wallet.to_file(file_name)
+
+    port_bind = args.port
+    metrics.enabled = bool(args.metrics_endpoint or args.metrics_dump)
+
+    node = Node(
+        port_bind,
+        wallet,
+        difficulty,
+        host=args.host,
+        template_builder=template_builder,
+        consensus_timeout=args.consensus_timeout,
+        consensus_quorum=args.consensus_quorum,
+        inv_interval=args.inv_interval,
+        inv_batch_size=args.inv_batch_size,
+        compact_blocks=not args.full_blocks,
+        indexed=args.index,
+        prune_depth=args.prune,
+        validation_workers=args.validation_workers,
+    )
+    metrics.register_collector("pipeline", node.tx_pipeline.stats)
+    metrics.register_collector("inbound", node.inbound.snapshot)
+
+    # the network threads only queue updates, the UI applies them
+    updates = PendingUpdates()
+    node.on_block.append(updates.push_block)
+    node.on_transaction.append(updates.push_transaction)
+    atexit.register(clean_file)
+
+    if args.metrics_endpoint:
+        serve(args.metrics_endpoint, node.context)
+    if args.metrics_dump:
+        dump_periodically(args.metrics_dump)
+    node.start()
+    if args.work_endpoint:
+        WorkServer(node, args.work_endpoint, args.work_notify_endpoint).start()
 
     app = QtWidgets.QApplication([])
 
     widget = MyWidget()
+    if args.bootstrap:
+        node.connect(args.bootstrap)
+        node.bootstrap(args.bootstrap, args.trusted_signer)
+        widget.define_peer(args.bootstrap)
 
     scrollArea = QtWidgets.QScrollArea()
 
@@ -0,0 +1,344 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import zmq
+
+from block import Block
+from chain import Blockchain
+from key import BitcoinAccount
+from keystore import KeyStore
+from rpc import RawJSON, dumps
+from transaction import Transaction
+from validation import ChainValidator
+
+GENESIS_TIMESTAMP = 1600000000.0
+
+
+def make_wallets(rng: random.Random, count: int) -> List[BitcoinAccount]:
+    return [
+        BitcoinAccount(rng.getrandbits(256).to_bytes(32, "big"))
+        for _ in range(count)
+    ]
+
+
+def make_transactions(
+    rng: random.Random,
+    wallets: List[BitcoinAccount],
+    count: int,
+    timestamp: float,
+) -> List[Transaction]:
+    transactions = []
+    for i in range(count):
+        sender, receiver = rng.sample(wallets, 2)
+        transaction = Transaction(
+            sender.to_address(),
+            receiver.to_address(),
+            float(rng.randint(1, 1000)),
+            timestamp + i * 1e-3,
+        )
+        transaction.sign(sender)
+        transactions.append(transaction)
+    return transactions
+
+
+def make_chain(
+    seed: int, blocks: int, transactions: int, difficulty: int
+) -> Blockchain:
+    rng = random.Random(seed)
+    wallets = make_wallets(rng, 8)
+    genesis = Block(index=0, previous_hash="", timestamp=GENESIS_TIMESTAMP)
+    genesis.mine(difficulty)
+    blockchain = Blockchain(difficulty, blocks=[genesis])
+
+    for height in range(1, blocks):
+        timestamp = GENESIS_TIMESTAMP + height
+        miner = rng.choice(wallets)
+        block = Block(
+            index=height,
+            previous_hash=blockchain.head.hashval,
+            timestamp=timestamp,
+            miner=miner.to_address(),
+        )
+        block.add_transactions(
+            make_transactions(rng, wallets, transactions, timestamp)
+        )
+        block.mine(difficulty)
+        block.sign(miner)
+        blockchain.blocks.append(block)
+    return blockchain
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.mean(timings),
+        "median": statistics.median(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def bench_mine(blockchain: Blockchain, options) -> Dict[str, Any]:
+    template = blockchain.head
+
+    def mine():
+        block = Block(
+            index=template.index,
+            previous_hash=template.previous_hash,
+            timestamp=template.timestamp,
+            miner=template.miner,
+            transactions=template.transactions,
+        )
+        block.mine(blockchain.difficulty)
+
+    return measure(mine, options.repeat)
+
+
+def bench_compute_hash(blockchain: Blockchain, options) -> Dict[str, Any]:
+    block = blockchain.head
+    iterations = 1000
+
+    def compute_hash():
+        for _ in range(iterations):
+            block.compute_hash()
+
+    result = measure(compute_hash, options.repeat)
+    result["iterations"] = iterations
+    return result
+
+
+def bench_is_valid(blockchain: Blockchain, options) -> Dict[str, Any]:
+    return measure(blockchain.is_valid, options.repeat)
+
+
+def bench_verify(blockchain: Blockchain, options) -> Dict[str, Any]:
+    def verify():
+        for block in blockchain.blocks[1:]:
+            block.verify()
+
+    return measure(verify, options.repeat)
+
+
+def bench_json(blockchain: Blockchain, options) -> Dict[str, Any]:
+    data = blockchain.to_json()
+    return {
+        "bytes": len(data),
+        "to_json": measure(blockchain.to_json, options.repeat),
+        "to_dict": measure(blockchain.to_dict, options.repeat),
+        "from_json": measure(
+            lambda: Blockchain.from_json(data), options.repeat
+        ),
+    }
+
+
+def bench_jsonfile(blockchain: Blockchain, options) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        pathfile = os.path.join(directory, "blockchain.json")
+        to_jsonfile = measure(
+            lambda: blockchain.to_jsonfile(pathfile), options.repeat
+        )
+        from_jsonfile = measure(
+            lambda: Blockchain.from_jsonfile(pathfile), options.repeat
+        )
+        size = os.path.getsize(pathfile)
+    return {
+        "bytes": size,
+        "to_jsonfile": to_jsonfile,
+        "from_jsonfile": from_jsonfile,
+    }
+
+
+def bench_validate(blockchain: Blockchain, options) -> Dict[str, Any]:
+    # hashes and signatures of every block, in this process then over a
+    # process pool
+    sequential = ChainValidator(workers=1)
+    parallel = ChainValidator(workers=options.workers)
+    try:
+        parallel.validate(blockchain)  # start the pool
+        return {
+            "workers": parallel.workers,
+            "sequential": measure(
+                lambda: sequential.validate(blockchain), options.repeat
+            ),
+            "parallel": measure(
+                lambda: parallel.validate(blockchain), options.repeat
+            ),
+        }
+    finally:
+        parallel.close()
+
+
+def bench_keystore(blockchain: Blockchain, options) -> Dict[str, Any]:
+    # as many keys and signatures as the chain has transactions
+    count = options.blocks * options.transactions
+    with tempfile.TemporaryDirectory() as directory:
+        keystore = KeyStore(os.path.join(directory, "keystore.bin"))
+        generate = measure(lambda: keystore.generate(count), options.repeat)
+        addresses = list(keystore)[:count]
+        transactions = [
+            Transaction(sender, receiver, 1.0, GENESIS_TIMESTAMP)
+            for sender, receiver in zip(addresses, reversed(addresses))
+        ]
+        sign = measure(
+            lambda: keystore.sign_transactions(transactions), options.repeat
+        )
+        keystore.close()
+    return {
+        "keys": count,
+        "workers": keystore.workers,
+        "generate": generate,
+        "addresses_per_second": count / generate["median"],
+        "sign": sign,
+        "signatures_per_second": count / sign["median"],
+    }
+
+
+def bench_sync(blockchain: Blockchain, options) -> Dict[str, Any]:
+    # one node announces its chain, the others decode and validate it, like
+    # a node does for add_peer
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+    subscribers = []
+    for _ in range(options.sync_nodes):
+        subscriber = context.socket(zmq.SUB)
+        subscriber.setsockopt_string(zmq.SUBSCRIBE, "")
+        subscriber.connect(f"tcp://127.0.0.1:{port}")
+        subscribers.append(subscriber)
+    time.sleep(0.5)  # let the subscriptions propagate
+
+    def receive(subscriber):
+        data = subscriber.recv_json()
+        peer_blockchain = Blockchain.from_dict(
+            data["parameters"]["blockchain"]
+        )
+        if not peer_blockchain.is_valid():
+            raise ValueError("Synced blockchain is not valid.")
+
+    def sync():
+        threads = [
+            threading.Thread(target=receive, args=(subscriber,))
+            for subscriber in subscribers
+        ]
+        for thread in threads:
+            thread.start()
+        # encoded like Node.publish does
+        publisher.send(
+            dumps(
+                {
+                    "operation": "add_peer",
+                    "parameters": {
+                        "blockchain": RawJSON(blockchain.to_json())
+                    },
+                }
+            ).encode("utf-8")
+        )
+        for thread in threads:
+            thread.join()
+
+    try:
+        result = measure(sync, options.repeat)
+    finally:
+        context.destroy(linger=0)
+    result["nodes"] = options.sync_nodes
+    return result
+
+
+SCENARIOS = {
+    "mine": bench_mine,
+    "compute_hash": bench_compute_hash,
+    "is_valid": bench_is_valid,
+    "verify": bench_verify,
+    "json": bench_json,
+    "jsonfile": bench_jsonfile,
+    "keystore": bench_keystore,
+    "validate": bench_validate,
+    "sync": bench_sync,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=20)
+    parser.add_argument("--difficulty", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sync-nodes", type=int, default=2)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes of the validate scenario (default: one per core)",
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="scenario to run, can be repeated (default: all)",
+    )
+    parser.add_argument("--output", help="write the results to this file")
+    options = parser.parse_args()
+
+    start = time.perf_counter()
+    blockchain = make_chain(
+        options.seed, options.blocks, options.transactions, options.difficulty
+    )
+    setup = time.perf_counter() - start
+
+    results = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {
+            "blocks": options.blocks,
+            "transactions": options.transactions,
+            "difficulty": options.difficulty,
+            "repeat": options.repeat,
+            "seed": options.seed,
+            "sync_nodes": options.sync_nodes,
+            "workers": options.workers,
+        },
+        "setup": setup,
+        "scenarios": {},
+    }
+    for name in options.scenario or SCENARIOS:
+        results["scenarios"][name] = SCENARIOS[name](blockchain, options)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,58 @@ import logging
 import time
 from dataclasses import asdict, dataclass, field
 from hashlib import sha256
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from key import Account, verify_signature
+from metrics import metrics
 from transaction import Transaction
 
 
+def _pair_hash(left: str, right: str) -> str:
+    return sha256((left + right).encode("utf-8")).hexdigest()
+
+
+def _next_level(level: List[str]) -> List[str]:
+    # pairs of hashes are hashed together, a hash left without a pair moves
+    # up unchanged
+    return [
+        _pair_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+        for i in range(0, len(level), 2)
+    ]
+
+
+def merkle_root(txids: List[str]) -> str:
+    if not txids:
+        return sha256(b"").hexdigest()
+    level = list(txids)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_branch(txids: List[str], position: int) -> List[Tuple[str, bool]]:
+    # the [hash, is_left] pairs that lead from the txid at `position` to
+    # the root, see root_from_branch
+    branch = []
+    level = list(txids)
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            branch.append((level[sibling], sibling < position))
+        level = _next_level(level)
+        position //= 2
+    return branch
+
+
+def root_from_branch(txid: str, branch: Iterable[Tuple[str, bool]]) -> str:
+    root = txid
+    for sibling, is_left in branch:
+        root = (
+            _pair_hash(sibling, root) if is_left else _pair_hash(root, sibling)
+        )
+    return root
+
+
 @dataclass
 class Block:
     index: int
@@ -20,6 +66,18 @@ class Block:
     hashval: Optional[str] = None
     transactions: List[Transaction] = field(default_factory=list)
     signature: Optional[str] = None
+    # commitment to the transactions, kept when they are pruned
+    merkle_root: Optional[str] = None
+
+    def __post_init__(self):
+        # serialized forms, built once, see to_dict and to_json
+        self._dict: Optional[Dict[str, Any]] = None
+        self._json: Optional[str] = None
+
+    def invalidate(self):
+        # to call after changing a block in place
+        self._dict = None
+        self._json = None
 
     def add_transactions(self, transactions: Iterable[Transaction]):
         for transaction in transactions:
@@ -28,24 +86,46 @@ class Block:
     def add_transaction(self, transaction: Transaction):
         transaction.tx_number = len(self.transactions)
         self.transactions.append(transaction)
+        self.merkle_root = None
+        self.invalidate()
 
-    def compute_hash(self) -> str:
-        data = (
-            str(self.index)
-            + str(self.previous_hash)
-            + str(self.nonce)
-            + str(self.timestamp)
-            + str(self.miner)
+    def compute_merkle_root(self) -> str:
+        return merkle_root(
+            [transaction.txid for transaction in self.transactions]
         )
-        for transaction in self.transactions:
-            data += (
-                str(transaction.sender)
-                + str(transaction.receiver)
-                + str(transaction.amount)
-            )
+
+    def transactions_root(self) -> str:
+        # computed once the transactions are added, then stored
+        if self.merkle_root is None:
+            self.merkle_root = self.compute_merkle_root()
+            self.invalidate()
+        return self.merkle_root
+
+    def root_is_valid(self) -> bool:
+        # the transactions hash to the stored root
+        return self.transactions_root() == self.compute_merkle_root()
+
+    def merkle_branch(self, position: int) -> List[Tuple[str, bool]]:
+        return merkle_branch(
+            [transaction.txid for transaction in self.transactions], position
+        )
+
+    def hash_parts(self) -> Tuple[str, str]:
+        # the hashed data before and after the nonce, of fixed size: the
+        # transactions are hashed through their root
+        prefix = str(self.index) + str(self.previous_hash)
+        suffix = (
+            str(self.timestamp) + str(self.miner) + self.transactions_root()
+        )
+        return prefix, suffix
+
+    def compute_hash(self) -> str:
+        prefix, suffix = self.hash_parts()
+        data = prefix + str(self.nonce) + suffix
         return sha256(data.encode("utf-8")).hexdigest()
 
     def mine(self, difficulty: int) -> str:
+        start, start_nonce = time.perf_counter(), self.nonce
         computed_hash = self.compute_hash()
 
         while not computed_hash.startswith("0" * difficulty):
@@ -53,10 +133,23 @@ class Block:
             computed_hash = self.compute_hash()
 
         self.hashval = computed_hash
+        self.invalidate()
+
+        if metrics.enabled:
+            elapsed = time.perf_counter() - start
+            hashes = self.nonce - start_nonce + 1
+            metrics.inc("mining.hashes", hashes)
+            metrics.observe("mining.time_to_solution", elapsed)
+            if elapsed > 0:
+                metrics.set_gauge("mining.hashrate", hashes / elapsed)
 
         return computed_hash
 
     def hash_is_valid(self, difficulty) -> bool:
+        if not self.root_is_valid():
+            logging.error(f"The transactions don't hash to {self.merkle_root}")
+            return False
+
         if self.compute_hash() != self.hashval:
             logging.error(
                 f"self.compute_hash()={self.compute_hash()} != self.hashval={self.hashval}"
@@ -68,8 +161,41 @@ class Block:
             return False
         return True
 
+    def header_is_valid(self, difficulty) -> bool:
+        # the hash is recomputed from the stored root, the transactions are
+        # not checked against it
+        if self.hashval is None or self.compute_hash() != self.hashval:
+            logging.error(f"hashval={self.hashval} doesn't match the header")
+            return False
+        if not self.hashval.startswith("0" * difficulty):
+            logging.error(f"hashval doesn't start with {difficulty} zero")
+            return False
+        return True
+
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        # a copy of the cached dict: changing it leaves the cache untouched
+        if self._dict is None:
+            self._dict = asdict(self)
+        data = dict(self._dict)
+        data["transactions"] = [
+            dict(transaction) for transaction in data["transactions"]
+        ]
+        return data
+
+    def to_json(self) -> str:
+        # same text as json.dumps(self.to_dict(), sort_keys=True)
+        if self._json is None:
+            if self._dict is None:
+                self._dict = asdict(self)
+            self._json = json.dumps(self._dict, sort_keys=True)
+        return self._json
+
+    def message(self) -> str:
+        # built from the fields, never from the cache
+        data = asdict(self)
+        del data["signature"]
+        data["merkle_root"] = self.transactions_root()
+        return json.dumps(data, sort_keys=True)
 
     @classmethod
     def from_dict(cls, data: dict):
@@ -84,20 +210,18 @@ class Block:
                 map(Transaction.from_dict, data["transactions"])
             ),
             signature=data["signature"],
+            merkle_root=data.get("merkle_root"),
         )
 
     def sign(self, wallet: Account):
-        data = self.to_dict()
-        del data["signature"]
-        message = json.dumps(data, sort_keys=True)
-        signature = wallet.sign(message)
+        signature = wallet.sign(self.message())
         self.signature = base64.b64encode(signature).decode("ascii")
+        self.invalidate()
         return signature
 
+    @metrics.timed("block.verify")
     def verify(self):
-        data = self.to_dict()
-        del data["signature"]
-        message = json.dumps(data, sort_keys=True)
+        message = self.message()
 
         if self.signature is None:
             logging.warning("Signature is None.")
@@ -127,6 +251,11 @@ class Block:
                 return False
 
         # check hash
+        if not self.root_is_valid():
+            logging.warning(
+                f"Transactions don't hash to merkle_root={self.merkle_root}"
+            )
+            return False
         computed_hash = self.compute_hash()
         if computed_hash != self.hashval:
             logging.warning(
@@ -1,11 +1,16 @@
+import itertools
 import json
 from key import BitcoinAccount
 import logging
+import os
 import time
-from dataclasses import asdict, dataclass, field
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from block import Block
+from indexer import ChainIndex
+from metrics import metrics
+from template import BlockTemplateBuilder
 from transaction import Transaction
 
 
@@ -15,15 +20,40 @@ class Blockchain:
     blocks: List[Block] = field(default_factory=list)
     tx_pool: List[Transaction] = field(default_factory=list)
     block_reward: float = 50.0
+    # blocks below this height lost their transactions, see prune, and
+    # the balances they leave are kept in their place
+    pruned_height: int = 0
+    pruned_balances: Dict[str, float] = field(default_factory=dict)
 
     def __post_init__(self):
-        self.create_genesis_block()
+        # optional secondary indexes, see enable_index
+        self.indexer: Optional[ChainIndex] = None
+        # signatures of the pool, for constant time membership checks
+        self.pool_signatures: Set[Optional[str]] = {
+            transaction.signature for transaction in self.tx_pool
+        }
+        # order in which the pool transactions arrived, by signature. The
+        # timestamps are set by the senders and cannot be trusted for it.
+        self._arrival_counter = itertools.count()
+        self.arrivals: Dict[Optional[str], int] = {
+            transaction.signature: next(self._arrival_counter)
+            for transaction in self.tx_pool
+        }
+        # txids of the pool by signature, hashed once per transaction
+        self.pool_txids: Dict[Optional[str], str] = {
+            transaction.signature: transaction.txid
+            for transaction in self.tx_pool
+        }
+        if not self.blocks:
+            self.create_genesis_block()
 
     @classmethod
     def create(cls, difficulty: int, wallet: BitcoinAccount):
         blockchain = cls(difficulty)
-        blockchain.head.sign(wallet)
+        # the miner is part of the hash: mine again once it is set
         blockchain.head.miner = wallet.to_address()
+        blockchain.head.mine(difficulty)
+        blockchain.head.sign(wallet)
         return blockchain
 
     def __len__(self):
@@ -43,11 +73,228 @@ class Blockchain:
     def head(self) -> Block:
         return self.blocks[-1]
 
+    def block_at(self, height: int) -> Optional[Block]:
+        row = height - self.blocks[0].index
+        if 0 <= row < len(self.blocks):
+            return self.blocks[row]
+        return None
+
+    def contains(self, block: Block) -> bool:
+        mine = self.block_at(block.index)
+        return mine is not None and mine.hashval == block.hashval
+
+    def prune(self, depth: int) -> int:
+        # drops the transactions of the blocks more than `depth` blocks
+        # below the head, their headers and hashes are kept
+        if depth < 1:
+            raise ValueError("The head cannot be pruned.")
+        height = self.head.index - depth + 1
+        for block in self.blocks:
+            if block.index >= height:
+                break
+            if block.index < self.pruned_height or not block.transactions:
+                continue
+            if self.indexer is not None:
+                self.indexer.prune(block)
+            apply_transactions(self.pruned_balances, block.transactions)
+            # the root stays in the header, the hash can still be recomputed
+            block.transactions_root()
+            block.transactions = []
+            block.invalidate()
+        self.pruned_height = max(self.pruned_height, height)
+        return self.pruned_height
+
+    def restore_bodies(self, other: "Blockchain") -> bool:
+        # takes back the transactions pruned from this chain when `other`
+        # has them for the very same blocks
+        if self.pruned_height <= other.pruned_height:
+            return False
+        pairs = []
+        for block in self.blocks:
+            if block.index >= self.pruned_height:
+                break
+            if block.index < other.pruned_height:
+                continue
+            theirs = other.block_at(block.index)
+            if theirs is None or theirs.hashval != block.hashval:
+                return False
+            pairs.append((block, theirs))
+        for block, theirs in pairs:
+            block.transactions = theirs.transactions
+            block.invalidate()
+        self.pruned_height = other.pruned_height
+        self.pruned_balances = dict(other.pruned_balances)
+        if self.indexer is not None:
+            self.enable_index()
+        return True
+
+    def adopt_pruned_state(self, trusted: "Blockchain") -> bool:
+        # a peer chooses its own pruned_height and pruned_balances, and the
+        # transactions of pruned blocks cannot be replayed. `trusted` is a
+        # chain checked by this node that holds the same blocks: the pruned
+        # state is taken from it, its bodies restored or this chain pruned to
+        # it.
+        if self.pruned_height == 0:
+            return True
+        if self.restore_bodies(trusted):
+            return True
+        if trusted.pruned_height < self.pruned_height:
+            return False
+        last = self.block_at(trusted.pruned_height - 1)
+        if last is None or not trusted.contains(last):
+            return False
+        for block in self.blocks:
+            if block.index >= trusted.pruned_height:
+                break
+            block.transactions = []
+            block.invalidate()
+        self.pruned_height = trusted.pruned_height
+        self.pruned_balances = dict(trusted.pruned_balances)
+        if self.indexer is not None:
+            self.enable_index()
+        return True
+
+    def restore_history(self, other: "Blockchain") -> bool:
+        # a chain bootstrapped from a snapshot starts at the snapshot block:
+        # prepends the blocks of `other` below it when both share that block
+        anchor = self.blocks[0]
+        theirs = other.block_at(anchor.index)
+        if anchor.index == 0 or theirs is None:
+            return False
+        if theirs.hashval != anchor.hashval:
+            return False
+        history = other.blocks[: anchor.index - other.blocks[0].index + 1]
+        if self.pruned_height > anchor.index + 1:
+            # pruned past the snapshot: the history is kept as headers
+            history = [replace(block, transactions=[]) for block in history]
+        elif other.pruned_height > anchor.index + 1:
+            return False
+        else:
+            self.pruned_height = other.pruned_height
+            self.pruned_balances = dict(other.pruned_balances)
+        self.blocks[:1] = history
+        if self.indexer is not None:
+            self.enable_index()
+        return True
+
+    def balances(self, height: Optional[int] = None) -> Dict[str, float]:
+        # balances once the blocks up to `height` (default: the head) are
+        # applied, NETWORK_ADMIN rewards are created from nothing
+        if height is None:
+            height = self.head.index
+        if height < self.pruned_height - 1:
+            raise ValueError(f"Block {height} is pruned.")
+        balances = dict(self.pruned_balances)
+        for block in self.blocks:
+            if block.index > height:
+                break
+            if not self.is_pruned(block):
+                apply_transactions(balances, block.transactions)
+        return balances
+
+    def is_pruned(self, block: Block) -> bool:
+        return block.index < self.pruned_height
+
+    def block_hash_is_valid(self, block: Block) -> bool:
+        # a pruned block is re-hashed from its root, its transactions are
+        # gone: the pruned blocks of a peer chain must be matched against a
+        # trusted chain, see adopt_pruned_state
+        if self.is_pruned(block):
+            return block.header_is_valid(self.difficulty)
+        return block.hash_is_valid(self.difficulty)
+
+    def enable_index(self):
+        self.indexer = ChainIndex.build(self.blocks)
+
+    def take_index(self, other: "Blockchain") -> bool:
+        # moves the index of `other` over to this chain: the blocks of
+        # `other` above the fork point are disconnected from it and the
+        # blocks of this chain above it connected. False if the index has to
+        # be rebuilt instead.
+        index = other.indexer
+        if (
+            index is None
+            or index.tip != other.head.hashval
+            or self.pruned_height != other.pruned_height
+        ):
+            return False
+        fork = other.head
+        while not self.contains(fork):
+            if other.is_pruned(fork):
+                return False
+            fork = other.block_at(fork.index - 1)
+            if fork is None:
+                return False
+        for block in reversed(other.blocks):
+            if block.index <= fork.index:
+                break
+            index.disconnect(block)
+        for block in self.blocks:
+            if block.index > fork.index:
+                index.connect(block)
+        other.indexer = None
+        self.indexer = index
+        return True
+
+    def transaction_position(self, txid: str) -> Optional[Tuple[int, int]]:
+        if self.indexer is not None:
+            return self.indexer.position(txid)
+        for block in self.blocks:
+            for tx_number, transaction in enumerate(block.transactions):
+                if transaction.txid == txid:
+                    return block.index, tx_number
+        return None
+
+    def get_transaction(self, txid: str) -> Optional[Transaction]:
+        position = self.transaction_position(txid)
+        if position is None:
+            return None
+        height, tx_number = position
+        return self.block_at(height).transactions[tx_number]
+
+    def address_history(self, address: str) -> List[Transaction]:
+        # oldest first, a transaction to oneself is listed once
+        if self.indexer is not None:
+            return [
+                self.block_at(height).transactions[tx_number]
+                for height, tx_number in self.indexer.history(address)
+            ]
+        return [
+            transaction
+            for block in self.blocks
+            for transaction in block.transactions
+            if address in (transaction.sender, transaction.receiver)
+        ]
+
+    def in_pool(self, transaction: Transaction) -> bool:
+        if transaction.signature is None:
+            return transaction in self.tx_pool
+        return transaction.signature in self.pool_signatures
+
     def add_transaction(self, transaction: Transaction):
-        if transaction not in self.tx_pool:
+        if not self.in_pool(transaction):
             self.tx_pool.append(transaction)
+            self.pool_signatures.add(transaction.signature)
+            self.arrivals[transaction.signature] = next(self._arrival_counter)
+            self.pool_txids[transaction.signature] = transaction.txid
+
+    def mine_block(
+        self,
+        wallet: BitcoinAccount,
+        builder: Optional[BlockTemplateBuilder] = None,
+    ) -> Optional[Block]:
+        new_block = self.block_template(wallet, builder)
+        if new_block is None:
+            return None
+        new_block.mine(self.difficulty)
+        return self.add_mined_block(new_block, wallet)
 
-    def mine_block(self, wallet: BitcoinAccount) -> Optional[Block]:
+    def block_template(
+        self,
+        wallet: BitcoinAccount,
+        builder: Optional[BlockTemplateBuilder] = None,
+    ) -> Optional[Block]:
+        # the next block, still to be mined. The pool is left untouched.
         if not self.tx_pool:
             return None
 
@@ -67,19 +314,69 @@ class Blockchain:
             timestamp=time.time(),
             signature="NETWORK_ADMIN",
         )
-        self.tx_pool.append(reward)
-        new_block.add_transactions(self.tx_pool)
-        new_block.mine(self.difficulty)
+        if builder is None:
+            builder = BlockTemplateBuilder()
+        new_block.add_transactions(
+            map(
+                replace,
+                builder.select(
+                    self.tx_pool, reserved=[reward], arrivals=self.arrivals
+                ),
+            )
+        )
+        return new_block
+
+    def add_mined_block(
+        self, new_block: Block, wallet: BitcoinAccount
+    ) -> Optional[Block]:
         result = self.__add_block(new_block)
-        result.sign(wallet)
-        self.tx_pool.clear()
+        if result:
+            result.sign(wallet)
+            self.remove_transactions(result.transactions)
         return result
 
     def add_block_from_peer(self, new_block: Block) -> Optional[Block]:
         result = self.__add_block(new_block)
-        self.tx_pool.clear()
+        if result:
+            self.remove_transactions(result.transactions)
         return result
 
+    def remove_transactions(self, transactions: Iterable[Transaction]):
+        signatures = {transaction.signature for transaction in transactions}
+        self.tx_pool = [
+            transaction
+            for transaction in self.tx_pool
+            if transaction.signature not in signatures
+        ]
+        self.pool_signatures -= signatures
+        for signature in signatures:
+            self.arrivals.pop(signature, None)
+            self.pool_txids.pop(signature, None)
+
+    def pool_by_txid(self) -> Dict[str, Transaction]:
+        return {
+            (
+                transaction.txid
+                if transaction.signature is None
+                else self.pool_txids[transaction.signature]
+            ): transaction
+            for transaction in self.tx_pool
+        }
+
+    def disconnect_block(self) -> Block:
+        # removes the head, its transactions go back to the pool
+        if len(self.blocks) == 1:
+            raise ValueError("The genesis block cannot be disconnected.")
+        if self.is_pruned(self.head):
+            raise ValueError("A pruned block cannot be disconnected.")
+        block = self.blocks.pop()
+        if self.indexer is not None:
+            self.indexer.disconnect(block)
+        for transaction in block.transactions:
+            if transaction.sender != "NETWORK_ADMIN":
+                self.add_transaction(replace(transaction, tx_number=None))
+        return block
+
     def __add_block(self, new_block: Block) -> Optional[Block]:
         if new_block.timestamp < self.head.timestamp:
             logging.warning("Block REJECTED: Timestamp is not valid.")
@@ -102,20 +399,26 @@ class Blockchain:
             )
             return None
 
-        if not new_block.hash_is_valid(self.difficulty):
+        if not self.block_hash_is_valid(new_block):
             logging.warning("Block REJECTED : Hash is not valid.")
             return None
 
         self.blocks.append(new_block)
+        if self.indexer is not None:
+            self.indexer.connect(new_block)
         return self.head
 
+    @metrics.timed("chain.is_valid")
     def is_valid(self) -> bool:
         result = True
-        previous_hash = ""
+        # a chain bootstrapped from a snapshot trusts its first block
+        previous_hash = (
+            self.blocks[0].previous_hash if self.blocks[0].index else ""
+        )
 
         for block in self.blocks:
             if (
-                not block.hash_is_valid(self.difficulty)
+                not self.block_hash_is_valid(block)
                 or previous_hash != block.previous_hash
             ):
                 logging.error(f"Got Blockchain: {self.blocks}")
@@ -128,14 +431,47 @@ class Blockchain:
         return result
 
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        # built from the cached dicts of the blocks
+        return {
+            "difficulty": self.difficulty,
+            "blocks": [block.to_dict() for block in self.blocks],
+            "tx_pool": [transaction.to_dict() for transaction in self.tx_pool],
+            "block_reward": self.block_reward,
+            "pruned_height": self.pruned_height,
+            "pruned_balances": dict(self.pruned_balances),
+        }
 
     def to_json(self) -> str:
-        return json.dumps(self.to_dict(), sort_keys=True)
+        # same text as json.dumps(self.to_dict(), sort_keys=True), the
+        # blocks are copied from their cached JSON
+        parts = {
+            "difficulty": json.dumps(self.difficulty),
+            "blocks": "["
+            + ", ".join(block.to_json() for block in self.blocks)
+            + "]",
+            "tx_pool": json.dumps(
+                [transaction.to_dict() for transaction in self.tx_pool],
+                sort_keys=True,
+            ),
+            "block_reward": json.dumps(self.block_reward),
+            "pruned_height": json.dumps(self.pruned_height),
+            "pruned_balances": json.dumps(
+                self.pruned_balances, sort_keys=True
+            ),
+        }
+        return (
+            "{"
+            + ", ".join(
+                f'"{key}": {part}' for key, part in sorted(parts.items())
+            )
+            + "}"
+        )
 
     def to_jsonfile(self, pathfile: str = "blockchain.json"):
         with open(pathfile, "w") as file:
-            json.dump(self.to_dict(), file, sort_keys=True)
+            file.write(self.to_json())
+        if self.indexer is not None:
+            self.indexer.to_jsonfile(pathfile + ".index")
 
     @classmethod
     def from_dict(cls, data: dict):
@@ -144,6 +480,11 @@ class Blockchain:
             blocks=list(map(Block.from_dict, data["blocks"])),
             tx_pool=list(map(Transaction.from_dict, data["tx_pool"])),
             block_reward=float(data["block_reward"]),
+            pruned_height=int(data.get("pruned_height", 0)),
+            pruned_balances={
+                address: float(amount)
+                for address, amount in data.get("pruned_balances", {}).items()
+            },
         )
 
     @classmethod
@@ -155,4 +496,25 @@ class Blockchain:
     def from_jsonfile(cls, pathfile: str = "blockchain.json"):
         with open(pathfile, "r") as file:
             data_dict = json.load(file)
-            return cls.from_dict(data_dict)
+            blockchain = cls.from_dict(data_dict)
+        if os.path.exists(pathfile + ".index"):
+            indexer = ChainIndex.from_jsonfile(pathfile + ".index")
+            if indexer.tip == blockchain.head.hashval:
+                blockchain.indexer = indexer
+            else:
+                logging.warning("Stale index file, rebuilding the index.")
+                blockchain.enable_index()
+        return blockchain
+
+
+def apply_transactions(
+    balances: Dict[str, float], transactions: Iterable[Transaction]
+):
+    for transaction in transactions:
+        if transaction.sender != "NETWORK_ADMIN":
+            balances[transaction.sender] = (
+                balances.get(transaction.sender, 0.0) - transaction.amount
+            )
+        balances[transaction.receiver] = (
+            balances.get(transaction.receiver, 0.0) + transaction.amount
+        )
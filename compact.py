@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field, replace
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Tuple
+
+from block import Block
+from transaction import Transaction
+
+# hex characters kept from the salted hash of a txid (48 bits)
+SHORT_ID_LENGTH = 12
+
+
+def short_id(salt: str, txid: str) -> str:
+    # salted with the block hash so that collisions differ between blocks
+    data = (salt + txid).encode("utf-8")
+    return sha256(data).hexdigest()[:SHORT_ID_LENGTH]
+
+
+@dataclass
+class CompactBlock:
+    # a block header with short ids in place of the transactions the
+    # receiver most likely already has in its pool
+    header: Dict[str, Any]
+    short_ids: List[str] = field(default_factory=list)
+    # [position, transaction] pairs sent in full, e.g. the mining reward
+    prefilled: List[Tuple[int, Dict[str, Any]]] = field(default_factory=list)
+
+    @property
+    def hashval(self) -> str:
+        return self.header["hashval"]
+
+    @classmethod
+    def from_block(cls, block: Block):
+        header = block.to_dict()
+        del header["transactions"]
+        compact = cls(header)
+        for position, transaction in enumerate(block.transactions):
+            if transaction.sender == "NETWORK_ADMIN":
+                compact.prefilled.append((position, transaction.to_dict()))
+            else:
+                compact.short_ids.append(
+                    short_id(block.hashval, transaction.txid)
+                )
+        return compact
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "header": self.header,
+            "short_ids": self.short_ids,
+            "prefilled": [list(pair) for pair in self.prefilled],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            header=data["header"],
+            short_ids=list(data["short_ids"]),
+            prefilled=[
+                (int(position), transaction)
+                for position, transaction in data["prefilled"]
+            ],
+        )
+
+    def __len__(self) -> int:
+        return len(self.short_ids) + len(self.prefilled)
+
+    def reconstruct(
+        self, pool: Dict[str, Transaction]
+    ) -> Tuple[List[Optional[Transaction]], List[int]]:
+        # returns the transactions found in `pool`, by txid, in block order,
+        # and the positions that still have to be fetched
+        by_short_id = {
+            short_id(self.hashval, txid): transaction
+            for txid, transaction in pool.items()
+        }
+        slots: List[Optional[Transaction]] = [None] * len(self)
+        for position, data in self.prefilled:
+            slots[position] = Transaction.from_dict(data)
+        short_ids = iter(self.short_ids)
+        for position, slot in enumerate(slots):
+            if slot is None:
+                slots[position] = by_short_id.get(next(short_ids))
+        missing = [
+            position
+            for position, transaction in enumerate(slots)
+            if transaction is None
+        ]
+        return slots, missing
+
+    def to_block(self, transactions: List[Transaction]) -> Block:
+        block = Block.from_dict({**self.header, "transactions": []})
+        # the pool copies are left untouched, tx_number is set on copies
+        for transaction in transactions:
+            block.add_transaction(replace(transaction))
+        return block
@@ -0,0 +1,108 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from block import Block
+
+# (block height, tx_number)
+Position = Tuple[int, int]
+
+
+class ChainIndex:
+    # secondary indexes of a chain, kept in step with the blocks it appends
+    # or disconnects: txid -> position and address -> positions
+    def __init__(self):
+        self.transactions: Dict[str, Position] = {}
+        self.addresses: Dict[str, List[Position]] = {}
+        self.tip: Optional[str] = None
+
+    @classmethod
+    def build(cls, blocks: Iterable[Block]):
+        index = cls()
+        for block in blocks:
+            index.connect(block)
+        return index
+
+    def connect(self, block: Block):
+        for tx_number, transaction in enumerate(block.transactions):
+            position = (block.index, tx_number)
+            self.transactions[transaction.txid] = position
+            for address in self._addresses(transaction):
+                self.addresses.setdefault(address, []).append(position)
+        self.tip = block.hashval
+
+    def disconnect(self, block: Block):
+        # `block` must be the last connected one: its positions are at the
+        # end of every list
+        for transaction in block.transactions:
+            self.transactions.pop(transaction.txid, None)
+            for address in self._addresses(transaction):
+                positions = self.addresses.get(address, [])
+                while positions and positions[-1][0] == block.index:
+                    positions.pop()
+                if not positions:
+                    self.addresses.pop(address, None)
+        self.tip = block.previous_hash
+
+    def prune(self, block: Block):
+        # `block` must be the oldest indexed one: its positions are at the
+        # start of every list
+        for transaction in block.transactions:
+            self.transactions.pop(transaction.txid, None)
+            for address in self._addresses(transaction):
+                positions = self.addresses.get(address, [])
+                start = 0
+                while (
+                    start < len(positions)
+                    and positions[start][0] == block.index
+                ):
+                    start += 1
+                del positions[:start]
+                if not positions:
+                    self.addresses.pop(address, None)
+
+    @staticmethod
+    def _addresses(transaction) -> List[str]:
+        if transaction.sender == "NETWORK_ADMIN":
+            return [transaction.receiver]
+        if transaction.sender == transaction.receiver:
+            return [transaction.sender]
+        return [transaction.sender, transaction.receiver]
+
+    def position(self, txid: str) -> Optional[Position]:
+        return self.transactions.get(txid)
+
+    def history(self, address: str) -> List[Position]:
+        return self.addresses.get(address, [])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tip": self.tip,
+            "transactions": self.transactions,
+            "addresses": self.addresses,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        index = cls()
+        index.tip = data["tip"]
+        index.transactions = {
+            txid: (int(height), int(tx_number))
+            for txid, (height, tx_number) in data["transactions"].items()
+        }
+        index.addresses = {
+            address: [
+                (int(height), int(tx_number))
+                for height, tx_number in positions
+            ]
+            for address, positions in data["addresses"].items()
+        }
+        return index
+
+    def to_jsonfile(self, pathfile: str):
+        with open(pathfile, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def from_jsonfile(cls, pathfile: str):
+        with open(pathfile, "r") as file:
+            return cls.from_dict(json.load(file))
@@ -0,0 +1,179 @@
+import base64
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import coincurve
+
+from key import BitcoinAccount, gen_private_key
+from transaction import Transaction
+
+MAGIC = b"KEYSTORE\x01"
+# P2PKH addresses are at most 35 characters, padded with NUL bytes
+ADDRESS_SIZE = 36
+KEY_SIZE = 32
+RECORD_SIZE = ADDRESS_SIZE + KEY_SIZE
+# smallest batch of keys or signatures sent to a worker process
+CHUNK_SIZE = 256
+
+
+def _generate_keys(count: int) -> List[Tuple[str, bytes]]:
+    keys = []
+    for _ in range(count):
+        private = gen_private_key()
+        keys.append((BitcoinAccount(private).to_address(), private))
+    return keys
+
+
+def _sign_messages(items: List[Tuple[bytes, str]]) -> List[str]:
+    signatures = []
+    for private, message in items:
+        signature = coincurve.PrivateKey(private).sign_recoverable(
+            message.encode()
+        )
+        signatures.append(base64.b64encode(signature).decode("ascii"))
+    return signatures
+
+
+class KeyStore:
+    # many private keys in one file of fixed-size records. Only the
+    # address -> record index is read when the file is opened, a key is
+    # read from disk the first time its address is used.
+    def __init__(
+        self,
+        pathfile: str = "wallets/keystore.bin",
+        workers: Optional[int] = None,
+    ):
+        self.pathfile = pathfile
+        self.workers = workers or os.cpu_count() or 1
+        self.records: Dict[str, int] = {}
+        self.accounts: Dict[str, BitcoinAccount] = {}
+        self._lock = threading.Lock()
+        # started on the first large batch, kept until close
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        if not os.path.exists(pathfile):
+            # the keys are stored in clear: readable by the owner only
+            descriptor = os.open(
+                pathfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600
+            )
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(MAGIC)
+        self._file = open(pathfile, "r+b")
+        self._load_index()
+
+    def _load_index(self):
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.pathfile} is not a keystore file.")
+        record = 0
+        while True:
+            data = self._file.read(RECORD_SIZE * 4096)
+            if not data:
+                break
+            for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+                address = data[offset : offset + ADDRESS_SIZE]
+                self.records[address.rstrip(b"\0").decode("ascii")] = record
+                record += 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._file.close()
+
+    def _chunks(self, items: Sequence) -> List[Sequence]:
+        # small batches stay in this process, the pool startup and the
+        # pickling would cost more than the work
+        size = max(CHUNK_SIZE, -(-len(items) // (self.workers * 4)))
+        return [items[i : i + size] for i in range(0, len(items), size)]
+
+    def _map(self, function: Callable[[Any], list], chunks: List) -> list:
+        if self.workers == 1 or len(chunks) == 1:
+            return [item for chunk in chunks for item in function(chunk)]
+        if self._executor is None:
+            # forked from a node, a worker could inherit a lock held by one
+            # of its threads
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return [
+            item
+            for chunk in self._executor.map(function, chunks)
+            for item in chunk
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self.records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.records))
+
+    def get(self, address: str) -> BitcoinAccount:
+        account = self.accounts.get(address)
+        if account is not None:
+            return account
+        with self._lock:
+            self._file.seek(
+                len(MAGIC) + self.records[address] * RECORD_SIZE + ADDRESS_SIZE
+            )
+            account = BitcoinAccount(self._file.read(KEY_SIZE))
+        self.accounts[address] = account
+        return account
+
+    def add(self, account: BitcoinAccount) -> str:
+        address = account.to_address()
+        self._append([(address, account.pk)])
+        self.accounts[address] = account
+        return address
+
+    def _append(self, keys: Iterable[Tuple[str, bytes]]):
+        with self._lock:
+            keys = [key for key in keys if key[0] not in self.records]
+            data = b"".join(
+                address.encode("ascii").ljust(ADDRESS_SIZE, b"\0") + private
+                for address, private in keys
+            )
+            self._file.seek(0, os.SEEK_END)
+            first = (self._file.tell() - len(MAGIC)) // RECORD_SIZE
+            self._file.write(data)
+            self._file.flush()
+            for record, (address, _) in enumerate(keys, first):
+                self.records[address] = record
+
+    def generate(self, count: int) -> List[str]:
+        # key derivation (EC multiplication, hashes, base58) is spread over
+        # a process pool, the records are written in one append
+        sizes = [len(chunk) for chunk in self._chunks(range(count))]
+        keys = self._map(_generate_keys, sizes)
+        self._append(keys)
+        return [address for address, _ in keys]
+
+    def sign_transactions(self, transactions: List[Transaction]):
+        # signs every transaction with the key of its sender
+        items = [
+            (self.get(transaction.sender).pk, transaction.message())
+            for transaction in transactions
+        ]
+        signatures = self._map(_sign_messages, self._chunks(items))
+        for transaction, signature in zip(transactions, signatures):
+            transaction.signature = signature
@@ -0,0 +1,266 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from hashlib import sha256
+from typing import Any, Dict, List, Optional
+
+import zmq
+
+from block import Block, root_from_branch
+from rpc import RpcClient
+from transaction import Transaction
+
+# most headers a node sends in one get_headers answer
+MAX_HEADERS = 2000
+
+
+@dataclass
+class Header:
+    index: int
+    previous_hash: str
+    timestamp: float
+    nonce: int
+    miner: Optional[str]
+    # commitment to the transactions of the block (see Block.merkle_root)
+    merkle_root: str
+    hashval: str
+
+    @classmethod
+    def from_block(cls, block: Block):
+        return cls(
+            index=block.index,
+            previous_hash=block.previous_hash,
+            timestamp=block.timestamp,
+            nonce=block.nonce,
+            miner=block.miner,
+            merkle_root=block.transactions_root(),
+            hashval=block.hashval,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            index=int(data["index"]),
+            previous_hash=data["previous_hash"],
+            timestamp=float(data["timestamp"]),
+            nonce=int(data["nonce"]),
+            miner=data["miner"],
+            merkle_root=data["merkle_root"],
+            hashval=data["hashval"],
+        )
+
+    def compute_hash(self) -> str:
+        # same data as Block.hash_parts
+        data = (
+            str(self.index)
+            + str(self.previous_hash)
+            + str(self.nonce)
+            + str(self.timestamp)
+            + str(self.miner)
+            + self.merkle_root
+        )
+        return sha256(data.encode("utf-8")).hexdigest()
+
+    def is_valid(self, difficulty: int) -> bool:
+        return self.hashval == self.compute_hash() and self.hashval.startswith(
+            "0" * difficulty
+        )
+
+
+class LightClient:
+    # follows the chain of full nodes with the block headers only, blocks
+    # and transactions are downloaded when asked for and checked against
+    # the headers
+    def __init__(
+        self,
+        peers: List[str],
+        difficulty: int,
+        context: Optional[zmq.Context] = None,
+        poll_interval: float = 1.0,
+    ):
+        self.peers = list(peers)
+        # never taken from the peers, whose headers it checks
+        self.difficulty = difficulty
+        self.context = context if context is not None else zmq.Context()
+        self.rpc = RpcClient(self.context)
+        self.poll_interval = poll_interval
+        self.headers: List[Header] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="light-client", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.rpc.close()
+
+    @property
+    def tip(self) -> Optional[Header]:
+        return self.headers[-1] if self.headers else None
+
+    def header(self, height: int) -> Optional[Header]:
+        if 0 <= height < len(self.headers):
+            return self.headers[height]
+        return None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            for peer in self.peers:
+                try:
+                    self.sync(peer)
+                except Exception as error:
+                    logging.warning(
+                        f"Header sync from {peer} failed: {error!r}"
+                    )
+
+    def sync(self, peer: str) -> bool:
+        # True if the headers of `peer` were adopted
+        head = self.rpc.call(peer, "get_head")
+        if head is None:
+            return False
+        tip = self.tip
+        if tip is not None and (
+            head["height"] <= tip.index or head["hash"] == tip.hashval
+        ):
+            return False
+
+        headers = self.headers[:]
+        start = len(headers)
+        while start <= head["height"]:
+            batch = [
+                Header.from_dict(data)
+                for data in self.rpc.call(
+                    peer, "get_headers", {"start": start, "count": MAX_HEADERS}
+                )
+            ]
+            if not batch:
+                break
+            if start and batch[0].previous_hash != headers[start - 1].hashval:
+                # the peer is on another branch: step back to the fork
+                start = max(0, start - MAX_HEADERS)
+                del headers[start:]
+                continue
+            if not self.check(headers, batch):
+                logging.error(f"Invalid headers from {peer}.")
+                return False
+            headers.extend(batch)
+            start = len(headers)
+
+        with self._lock:
+            if self.tip is not None and len(headers) <= len(self.headers):
+                return False
+            self.headers = headers
+        return True
+
+    def check(self, headers: List[Header], batch: List[Header]) -> bool:
+        previous = headers[-1] if headers else None
+        for header in batch:
+            if previous is None:
+                linked = header.index == 0 and header.previous_hash == ""
+            else:
+                linked = (
+                    header.index == previous.index + 1
+                    and header.previous_hash == previous.hashval
+                    and header.timestamp >= previous.timestamp
+                )
+            if not linked or not header.is_valid(self.difficulty):
+                return False
+            previous = header
+        return True
+
+    def get_block(self, height: int, peer: Optional[str] = None) -> Block:
+        # the block is only returned if it hashes to the synced header
+        header = self.header(height)
+        if header is None:
+            raise LookupError(f"No header at height {height}.")
+        data = self.rpc.call(
+            peer or self.peers[0], "get_block", {"height": height}
+        )
+        if data is None:
+            raise LookupError(f"Block {height} not found.")
+        block = Block.from_dict(data)
+        if (
+            block.hashval != header.hashval
+            or block.compute_hash() != header.hashval
+            or not block.root_is_valid()
+        ):
+            raise ValueError(f"Block {height} does not match its header.")
+        return block
+
+    def get_transaction(
+        self, txid: str, peer: Optional[str] = None, verify: bool = True
+    ) -> Optional[Transaction]:
+        # the transaction comes with the branch that leads from its txid to
+        # the root of its block, checked against the synced header
+        peer = peer or self.peers[0]
+        data = self.rpc.call(peer, "get_transaction", {"txid": txid})
+        if data is None:
+            return None
+        transaction = Transaction.from_dict(data["transaction"])
+        if not verify:
+            return transaction
+        header = self.header(data["height"])
+        if header is None:
+            raise LookupError(f"No header at height {data['height']}.")
+        if transaction.txid != txid or (
+            root_from_branch(txid, data["branch"]) != header.merkle_root
+        ):
+            raise ValueError(f"Transaction {txid} is not in its block.")
+        return transaction
+
+    def to_jsonfile(self, pathfile: str = "headers.json"):
+        with open(pathfile, "w") as file:
+            json.dump([header.to_dict() for header in self.headers], file)
+
+    def load_jsonfile(self, pathfile: str = "headers.json"):
+        with open(pathfile, "r") as file:
+            headers = [Header.from_dict(header) for header in json.load(file)]
+        if not self.check([], headers):
+            raise ValueError(f"{pathfile} holds invalid headers.")
+        self.headers = headers
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Follow a chain with its block headers only."
+    )
+    parser.add_argument("peer", nargs="+", help="full node, e.g. host:5000")
+    parser.add_argument(
+        "--difficulty",
+        type=int,
+        default=3,
+        help="leading zeros of the block hashes of the chain",
+    )
+    parser.add_argument("--interval", type=float, default=1.0)
+    options = parser.parse_args()
+
+    client = LightClient(
+        options.peer, options.difficulty, poll_interval=options.interval
+    )
+    tip = None
+    client.start()
+    try:
+        while True:
+            time.sleep(options.interval)
+            if client.tip is not None and client.tip != tip:
+                tip = client.tip
+                print(f"Head {tip.index}: {tip.hashval}")
+    except KeyboardInterrupt:
+        client.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+import zmq
+
+# latency buckets in seconds, from 1µs to ~100s
+DEFAULT_BUCKETS = [10 ** (exponent / 2) for exponent in range(-12, 5)]
+
+
+class Histogram:
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = DEFAULT_BUCKETS if buckets is None else buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "buckets": dict(
+                zip(
+                    [f"{bound:.6g}" for bound in self.buckets] + ["+Inf"],
+                    self.counts,
+                )
+            ),
+        }
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.collectors: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def register_collector(self, name: str, collector: Callable[[], Any]):
+        self.collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        uptime = time.time() - self.started
+        with self._lock:
+            data = {
+                "enabled": self.enabled,
+                "uptime": uptime,
+                "counters": dict(self.counters),
+                "rates": {
+                    name: value / uptime if uptime else 0.0
+                    for name, value in self.counters.items()
+                },
+                "gauges": dict(self.gauges),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+        for name, collector in self.collectors.items():
+            try:
+                data[name] = collector()
+            except Exception:
+                logging.exception(f"Metrics collector {name} failed.")
+        return data
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+metrics = Metrics()
+
+
+def serve(endpoint: str, context=None) -> threading.Thread:
+    # pull endpoint: any request on the REP socket gets the snapshot back
+    if context is None:
+        context = zmq.Context.instance()
+    socket = context.socket(zmq.REP)
+    socket.bind(endpoint)
+
+    def run():
+        while True:
+            try:
+                socket.recv()
+                socket.send_string(json.dumps(metrics.snapshot()))
+            except zmq.ContextTerminated:
+                return
+            except Exception:
+                logging.exception("Metrics endpoint failed.")
+
+    thread = threading.Thread(target=run, name="metrics", daemon=True)
+    thread.start()
+    return thread
+
+
+def dump_periodically(
+    interval: float, pathfile: Optional[str] = None
+) -> threading.Thread:
+    def run():
+        while True:
+            time.sleep(interval)
+            text = json.dumps(metrics.snapshot(), sort_keys=True)
+            if pathfile is None:
+                logging.warning(f"Metrics: {text}")
+            else:
+                with open(pathfile, "w") as file:
+                    file.write(text)
+
+    thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
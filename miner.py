@@ -0,0 +1,124 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import time
+from hashlib import sha256
+from typing import Any, Dict, Optional
+
+import zmq
+
+# nonces tried between two checks for a new template
+BATCH_SIZE = 10_000
+
+
+def search(work: Dict[str, Any], start: int, end: int) -> Optional[int]:
+    target = "0" * work["difficulty"]
+    prefix = sha256(work["prefix"].encode("utf-8"))
+    suffix = work["suffix"].encode("utf-8")
+    for nonce in range(start, end):
+        # the prefix is hashed once per template
+        candidate = prefix.copy()
+        candidate.update(str(nonce).encode("utf-8") + suffix)
+        if candidate.hexdigest().startswith(target):
+            return nonce
+    return None
+
+
+class Miner:
+    # asks the work server of a node for nonce ranges, searches them and
+    # submits the solutions. A template published by the server ends the
+    # search of the previous one.
+    def __init__(self, endpoint: str, notify_endpoint: str):
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect(endpoint)
+        self.notify = self.context.socket(zmq.SUB)
+        self.notify.setsockopt_string(zmq.SUBSCRIBE, "")
+        self.notify.connect(notify_endpoint)
+        self.latest_job: Optional[int] = None
+
+    def request(self, method: str, params: Any = None) -> Dict[str, Any]:
+        self.socket.send(
+            json.dumps({"method": method, "params": params}).encode()
+        )
+        return json.loads(self.socket.recv())
+
+    def poll_notifications(self, timeout: int = 0) -> bool:
+        # True if a new template was published
+        changed = False
+        while self.notify.poll(timeout):
+            self.latest_job = json.loads(self.notify.recv())["job_id"]
+            changed, timeout = True, 0
+        return changed
+
+    def mine(self, work: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self.latest_job = work["job_id"]
+        for start in range(work["start"], work["end"], BATCH_SIZE):
+            if self.poll_notifications() and self.latest_job != work["job_id"]:
+                return None
+            nonce = search(work, start, min(start + BATCH_SIZE, work["end"]))
+            if nonce is None:
+                continue
+            return self.request(
+                "submit", {"job_id": work["job_id"], "nonce": nonce}
+            )
+        return None
+
+    def run(self):
+        while True:
+            work = self.request("get_work")
+            if "error" in work:
+                logging.error(f"Work server error: {work['error']}")
+                time.sleep(1)
+                continue
+            if work["job_id"] is None:
+                # nothing to mine until the server publishes a template
+                self.poll_notifications(1000)
+                continue
+            result = self.mine(work)
+            if result is not None:
+                if result["accepted"]:
+                    logging.info(f"Block accepted: {result['hash']}")
+                else:
+                    logging.warning(f"Solution refused: {result['reason']}")
+
+
+def run_miner(endpoint: str, notify_endpoint: str):
+    logging.getLogger().setLevel(logging.INFO)
+    Miner(endpoint, notify_endpoint).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mine the blocks of a node running a work server."
+    )
+    parser.add_argument("--endpoint", default="tcp://127.0.0.1:5600")
+    parser.add_argument("--notify-endpoint", default="tcp://127.0.0.1:5601")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="miner processes, each asks for its own nonce ranges",
+    )
+    options = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(
+            target=run_miner,
+            args=(options.endpoint, options.notify_endpoint),
+            daemon=True,
+        )
+        for _ in range(options.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+
+import zmq
+from zmq.sugar.socket import Socket
+
+from block import Block
+from metrics import metrics
+
+
+@dataclass
+class Job:
+    job_id: int
+    block: Block
+    prefix: str
+    suffix: str
+    created: float
+    # first nonce not handed out yet
+    next_nonce: int = 0
+
+    def template(self, difficulty: int) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "height": self.block.index,
+            "difficulty": difficulty,
+            "prefix": self.prefix,
+            "suffix": self.suffix,
+        }
+
+
+class WorkServer:
+    # hands the block template of a node out to external miners (see
+    # miner.py). Miners ask for work and submit solutions on a ROUTER
+    # socket, every new template is published on a PUB socket so that they
+    # drop the work of a stale one.
+    def __init__(
+        self,
+        node,
+        endpoint: str = "tcp://127.0.0.1:5600",
+        notify_endpoint: str = "tcp://127.0.0.1:5601",
+        range_size: int = 100_000,
+        template_age: float = 30.0,
+    ):
+        self.node = node
+        self.range_size = range_size
+        # older templates are rebuilt to take in the new transactions
+        self.template_age = template_age
+        self.job: Optional[Job] = None
+        # when the template was last built, even if there was nothing to mine
+        self._refreshed = 0.0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.socket: Socket = node.context.socket(zmq.ROUTER)
+        self.socket.bind(endpoint)
+        self.notify_socket: Socket = node.context.socket(zmq.PUB)
+        self.notify_socket.bind(notify_endpoint)
+        self._notify_lock = threading.Lock()
+        # id of the last published job, None for no job
+        self._published: Optional[int] = None
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        node.on_block.append(self.on_block)
+        node.on_transaction.append(self.on_transaction)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="work-server", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.socket.close(linger=0)
+        self.notify_socket.close(linger=0)
+
+    def on_block(self, block: Block):
+        job = self.job
+        if job is None or job.block.previous_hash != block.hashval:
+            self.refresh()
+
+    def on_transaction(self, transaction):
+        # the first transaction of an empty pool gives a template to mine
+        if self.job is None:
+            self.refresh()
+
+    def refresh(self) -> Optional[Job]:
+        # a new template on top of the current head, the work handed out
+        # for the previous one is stale from now on
+        blockchain = self.node.blockchain
+        if blockchain is None:
+            return None
+        with self.node.chain_lock:
+            block = blockchain.block_template(
+                self.node.wallet, self.node.template_builder
+            )
+        with self._lock:
+            if block is None:
+                self.job = None
+            else:
+                prefix, suffix = block.hash_parts()
+                self.job = Job(
+                    next(self._ids), block, prefix, suffix, time.time()
+                )
+                metrics.inc("work.jobs")
+            self._refreshed = time.time()
+            job = self.job
+        self.publish(job)
+        return job
+
+    def publish(self, job: Optional[Job]):
+        # every message wakes the miners up, a job is only published once
+        job_id = None if job is None else job.job_id
+        message = (
+            {"job_id": None}
+            if job is None
+            else job.template(self.node.blockchain.difficulty)
+        )
+        with self._notify_lock:
+            if job_id == self._published:
+                return
+            self._published = job_id
+            self.notify_socket.send(json.dumps(message).encode())
+
+    def get_work(self, params) -> Dict[str, Any]:
+        # a missing template is not rebuilt on every request: on_block and
+        # on_transaction rebuild it as soon as there is something to mine
+        job = self.job
+        if time.time() - self._refreshed > self.template_age:
+            job = self.refresh()
+        if job is None:
+            return {"job_id": None}
+        with self._lock:
+            start = job.next_nonce
+            job.next_nonce += self.range_size
+        work = job.template(self.node.blockchain.difficulty)
+        work.update({"start": start, "end": start + self.range_size})
+        return work
+
+    def submit(self, params) -> Dict[str, Any]:
+        with self._lock:
+            job = self.job
+            if job is None or job.job_id != params["job_id"]:
+                metrics.inc("work.stale")
+                return {"accepted": False, "reason": "stale"}
+            nonce = int(params["nonce"])
+            if not 0 <= nonce < job.next_nonce:
+                metrics.inc("work.rejected")
+                return {"accepted": False, "reason": "nonce not handed out"}
+            block = replace(job.block, nonce=nonce)
+            block.hashval = block.compute_hash()
+            if not block.header_is_valid(self.node.blockchain.difficulty):
+                metrics.inc("work.rejected")
+                return {"accepted": False, "reason": "invalid"}
+            # one solution per job
+            self.job = None
+
+        if self.node.submit_block(block) is None:
+            metrics.inc("work.rejected")
+            self.refresh()
+            return {"accepted": False, "reason": "rejected by the chain"}
+        metrics.inc("work.accepted")
+        self.refresh()
+        return {"accepted": True, "hash": block.hashval}
+
+    def dispatch(self, payload: bytes) -> Dict[str, Any]:
+        handlers = {"get_work": self.get_work, "submit": self.submit}
+        try:
+            request = json.loads(payload)
+            return handlers[request["method"]](request.get("params"))
+        except Exception as error:
+            logging.exception("Work request failed.")
+            return {"error": repr(error)}
+
+    def _run(self):
+        while self._running:
+            try:
+                if not self.socket.poll(100):
+                    continue
+                identity, empty, payload = self.socket.recv_multipart()
+                reply = self.dispatch(payload)
+                self.socket.send_multipart(
+                    [identity, empty, json.dumps(reply).encode()]
+                )
+            except Exception:
+                logging.exception("Work server failed.")
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+from PySide2.QtCore import (
+    QAbstractItemModel,
+    QAbstractListModel,
+    QModelIndex,
+    Qt,
+)
+
+from block import Block
+from chain import Blockchain
+from transaction import Transaction
+
+# internalId of a top level (block) index, transaction indexes store the
+# row of their block plus one
+BLOCK_ID = 0
+
+
+class ChainModel(QAbstractItemModel):
+    headers = ["Height", "Hash", "Transactions", "Timestamp", "Miner"]
+
+    def __init__(self, blockchain: Blockchain, parent=None):
+        super().__init__(parent)
+        # the chain is viewed as it was when the model was built: copies of
+        # the block list and of the transaction lists, so that blocks
+        # appended, restored or pruned later do not move the rows
+        self.blocks: List[Block] = list(blockchain.blocks)
+        self.transactions: List[List[Transaction]] = [
+            list(block.transactions) for block in self.blocks
+        ]
+        self.count = len(self.blocks)
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, BLOCK_ID)
+        return self.createIndex(row, column, parent.row() + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == BLOCK_ID:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, BLOCK_ID)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return self.count
+        if parent.internalId() == BLOCK_ID and parent.column() == 0:
+            return len(self.transactions[parent.row()])
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def hasChildren(self, parent=QModelIndex()):
+        return self.rowCount(parent) > 0
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        if index.internalId() == BLOCK_ID:
+            block = self.blocks[index.row()]
+            return [
+                block.index,
+                block.hashval,
+                len(self.transactions[index.row()]),
+                time.ctime(block.timestamp),
+                block.miner,
+            ][index.column()]
+
+        transaction = self.transactions[index.internalId() - 1][index.row()]
+        return [
+            transaction.tx_number,
+            f"{transaction.sender} -> {transaction.receiver}",
+            transaction.amount,
+            time.ctime(transaction.timestamp),
+            None,
+        ][index.column()]
+
+    def item(self, index) -> Optional[Any]:
+        if not index.isValid():
+            return None
+        if index.internalId() == BLOCK_ID:
+            return self.blocks[index.row()]
+        return self.transactions[index.internalId() - 1][index.row()]
+
+    def details(self, index) -> str:
+        # serialized on demand, only for the selected row
+        item = self.item(index)
+        if item is None:
+            return ""
+        return json.dumps(item.to_dict(), indent=4, sort_keys=True)
+
+    def index_of_height(self, height: int) -> QModelIndex:
+        if self.count == 0:
+            return QModelIndex()
+        row = height - self.blocks[0].index
+        if 0 <= row < self.count:
+            return self.index(row, 0)
+        return QModelIndex()
+
+    def index_of_hash(self, hashval: str) -> QModelIndex:
+        for row in range(self.count - 1, -1, -1):
+            if self.blocks[row].hashval == hashval:
+                return self.index(row, 0)
+        return QModelIndex()
+
+
+class TransactionPoolModel(QAbstractListModel):
+    # shows the newest `capacity` pending transactions
+    def __init__(self, capacity: int = 500, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.transactions: List[Transaction] = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.transactions)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        transaction = self.transactions[index.row()]
+        if role == Qt.DisplayRole:
+            return (
+                f"{transaction.amount} : "
+                f"{transaction.sender} -> {transaction.receiver}"
+            )
+        if role == Qt.ToolTipRole:
+            return json.dumps(transaction.to_dict(), indent=2, sort_keys=True)
+        return None
+
+    def append(self, transactions: List[Transaction]):
+        transactions = transactions[-self.capacity :]
+        if not transactions:
+            return
+        overflow = len(self.transactions) + len(transactions) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            del self.transactions[:overflow]
+            self.endRemoveRows()
+        first = len(self.transactions)
+        self.beginInsertRows(
+            QModelIndex(), first, first + len(transactions) - 1
+        )
+        self.transactions.extend(transactions)
+        self.endInsertRows()
+
+    def reset(self, transactions: List[Transaction]):
+        self.beginResetModel()
+        self.transactions = list(transactions[-self.capacity :])
+        self.endResetModel()
+
+
+class PendingUpdates:
+    # filled from the network threads, drained by the UI at a fixed rate
+    def __init__(self, capacity: int = 500):
+        self.transactions: "deque[Transaction]" = deque(maxlen=capacity)
+        self.block: Optional[Block] = None
+        self._lock = threading.Lock()
+
+    def push_block(self, block: Block):
+        with self._lock:
+            self.block = block
+            # the pool is reloaded from the chain with the new block
+            self.transactions.clear()
+
+    def push_transaction(self, transaction: Transaction):
+        with self._lock:
+            self.transactions.append(transaction)
+
+    def drain(self) -> Tuple[Optional[Block], List[Transaction]]:
+        with self._lock:
+            block, self.block = self.block, None
+            transactions = list(self.transactions)
+            self.transactions.clear()
+        return block, transactions
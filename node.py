@@ -0,0 +1,1039 @@
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+import zmq
+from zmq.sugar.socket import Socket
+
+from block import Block
+from chain import Blockchain
+from compact import CompactBlock
+from key import BitcoinAccount
+from light import MAX_HEADERS, Header
+from metrics import metrics
+from pipeline import TransactionPipeline
+from relay import INV_TOPIC, InventoryRelay
+from rpc import (
+    RPC_PORT_OFFSET,
+    RawJSON,
+    RpcClient,
+    RpcServer,
+    dumps,
+    map_future,
+)
+from scheduler import InboundScheduler
+from snapshot import Snapshot
+from template import BlockTemplateBuilder
+from transaction import Transaction
+from validation import ChainValidator
+
+
+@dataclass
+class ConsensusRound:
+    request_id: str
+    quorum: int
+    responders: Set[str] = field(default_factory=set)
+    # get_head answers by peer, None for a peer without a chain
+    heads: Dict[str, Optional[dict]] = field(default_factory=dict)
+    timed_out: bool = False
+    future: Future = field(default_factory=Future)
+    timer: Optional[threading.Timer] = None
+
+
+class Node:
+    def __init__(
+        self,
+        port: str,
+        wallet: BitcoinAccount,
+        difficulty: int = 3,
+        host: str = "localhost",
+        bind_host: str = "*",
+        context: Optional[zmq.Context] = None,
+        template_builder: Optional[BlockTemplateBuilder] = None,
+        consensus_timeout: float = 2.0,
+        consensus_quorum: Optional[int] = None,
+        inv_interval: float = 0.1,
+        inv_batch_size: int = 500,
+        compact_blocks: bool = True,
+        indexed: bool = False,
+        prune_depth: Optional[int] = None,
+        validation_workers: Optional[int] = None,
+    ):
+        self.port = str(port)
+        self.address = host + ":" + self.port
+        self.wallet = wallet
+        self.difficulty = difficulty
+        self.template_builder = template_builder
+        self.compact_blocks = compact_blocks
+        # keep txid and address indexes on every chain the node adopts
+        self.indexed = indexed
+        # keep the transactions of the last `prune_depth` blocks only
+        self.prune_depth = prune_depth
+        # chains from peers are checked over a process pool when set
+        self.validator: Optional[ChainValidator] = None
+        if validation_workers is not None:
+            self.validator = ChainValidator(validation_workers)
+        self.consensus_timeout = consensus_timeout
+        # None waits for every known peer
+        self.consensus_quorum = consensus_quorum
+        self.consensus_rounds: Dict[str, ConsensusRound] = {}
+        self.consensus_lock = threading.Lock()
+        # a round started by catch_up is not over yet
+        self.catching_up = False
+        self.blockchain: Optional[Blockchain] = None
+        # imported snapshot whose history is not verified yet
+        self.snapshot: Optional[Snapshot] = None
+        # the chain made from it, and the chain held before the import,
+        # restored if the history does not lead to the snapshot
+        self.snapshot_chain: Optional[Blockchain] = None
+        self.pre_snapshot: Optional[Blockchain] = None
+        self.served_snapshot: Optional[Snapshot] = None
+        self.peers: Set[str] = set()
+
+        self.on_block: List[Callable[[Block], None]] = []
+        self.on_transaction: List[Callable[[Transaction], None]] = []
+
+        # gossip traffic, the requests are counted by the RPC server and
+        # client, see bytes_sent
+        self.gossip_bytes_sent = 0
+        self.gossip_bytes_received = 0
+        self.gossip_messages_sent = 0
+        self.gossip_messages_received = 0
+
+        self.context = context if context is not None else zmq.Context()
+        # XPUB: the subscriptions of the peers tell their addresses, see
+        # read_subscriptions
+        self.socket: Socket = self.context.socket(zmq.XPUB)
+        self.socket.bind("tcp://%s:%s" % (bind_host, self.port))
+        self.socket_sub: Socket = self.context.socket(zmq.SUB)
+        # every gossip message is a JSON object, inv messages are sent to
+        # one subscriber at a time under its own topic
+        self.socket_sub.setsockopt(zmq.SUBSCRIBE, b"{")
+        self.socket_sub.setsockopt(
+            zmq.SUBSCRIBE, INV_TOPIC + self.address.encode()
+        )
+        # addresses of the nodes subscribed to this one
+        self.subscribers: Set[str] = set()
+        self._subscriptions_read = 0.0
+
+        # zmq sockets are not thread-safe: the network thread, the
+        # transaction pipeline and the caller all publish
+        self.socket_lock = threading.Lock()
+        self.chain_lock = threading.RLock()
+
+        # chain validation must not run on the RPC I/O thread
+        self.sync_executor = ThreadPoolExecutor(1, "sync")
+
+        self.tx_pipeline = TransactionPipeline(self.admit_transaction)
+        # the messages read from the peers, blocks before transactions.
+        # Whole chains are decoded and validated on the sync thread, blocks
+        # do not wait for them.
+        self.inbound = InboundScheduler(
+            self.handle_message, executors={"chain": self.sync_executor}
+        )
+
+        # point-to-point requests, next to the PUB/SUB gossip
+        self.rpc_port = str(int(self.port) + RPC_PORT_OFFSET)
+        self.rpc_server = RpcServer(
+            self.context,
+            "tcp://%s:%s" % (bind_host, self.rpc_port),
+            {
+                "get_chain": self.rpc_get_chain,
+                "get_head": self.rpc_get_head,
+                "get_headers": self.rpc_get_headers,
+                "get_block": self.rpc_get_block,
+                "get_block_transactions": self.rpc_get_block_transactions,
+                "get_transaction": self.rpc_get_transaction,
+                "get_history": self.rpc_get_history,
+                "get_snapshot": self.rpc_get_snapshot,
+            },
+        )
+        self.rpc = RpcClient(self.context)
+
+        # without an announce interval transactions are relayed in full
+        self.relay: Optional[InventoryRelay] = None
+        if inv_interval:
+            self.relay = InventoryRelay(
+                self.address,
+                self.publish_to,
+                lambda: set(self.subscribers),
+                self.rpc,
+                self.tx_pipeline.submit,
+                interval=inv_interval,
+                batch_size=inv_batch_size,
+            )
+            self.rpc_server.handlers["getdata"] = self.relay.getdata
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running = True
+        self.tx_pipeline.start()
+        self.inbound.start()
+        self.rpc_server.start()
+        if self.relay is not None:
+            self.relay.start()
+        self._thread = threading.Thread(
+            target=self.reading_network, name=f"node-{self.port}"
+        )
+        self._thread.daemon = True  #  to close when main loop close
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.inbound.stop()
+        self.tx_pipeline.stop()
+        if self.relay is not None:
+            self.relay.stop()
+        self.rpc_server.stop()
+        self.rpc.close()
+        self.sync_executor.shutdown()
+        if self.validator is not None:
+            self.validator.close()
+        self.socket.close(linger=0)
+        self.socket_sub.close(linger=0)
+
+    def connect(self, peer: str):
+        if peer == self.address or peer in self.peers:
+            return
+        self.peers.add(peer)
+        self.socket_sub.connect("tcp://%s" % peer)
+
+    def disconnect(self, peer: str):
+        if peer not in self.peers:
+            return
+        self.peers.remove(peer)
+        self.socket_sub.disconnect("tcp://%s" % peer)
+        self.rpc.forget(peer)
+
+    # per-node traffic, gossip and requests in both directions, used by the
+    # simulation harness
+    @property
+    def bytes_sent(self) -> int:
+        return (
+            self.gossip_bytes_sent
+            + self.rpc.bytes_sent
+            + self.rpc_server.bytes_sent
+        )
+
+    @property
+    def bytes_received(self) -> int:
+        return (
+            self.gossip_bytes_received
+            + self.rpc.bytes_received
+            + self.rpc_server.bytes_received
+        )
+
+    @property
+    def messages_sent(self) -> int:
+        return (
+            self.gossip_messages_sent
+            + self.rpc.messages_sent
+            + self.rpc_server.messages_sent
+        )
+
+    @property
+    def messages_received(self) -> int:
+        return (
+            self.gossip_messages_received
+            + self.rpc.messages_received
+            + self.rpc_server.messages_received
+        )
+
+    def publish(self, message: dict):
+        data = dumps(message).encode("utf-8")
+        with self.socket_lock:
+            self.socket.send(data)
+            # one copy goes to every subscriber
+            self.gossip_bytes_sent += len(data) * len(self.subscribers)
+            self.gossip_messages_sent += len(self.subscribers)
+
+    def publish_to(self, peer: str, message: dict):
+        # reaches the subscriber `peer` only, the PUB side filters topics
+        topic = INV_TOPIC + peer.encode()
+        data = dumps(message).encode("utf-8")
+        with self.socket_lock:
+            self.socket.send_multipart([topic, data])
+            self.gossip_bytes_sent += len(topic) + len(data)
+            self.gossip_messages_sent += 1
+
+    def read_subscriptions(self):
+        # at most every 100 ms: the socket is shared with the publishers
+        now = time.monotonic()
+        if now - self._subscriptions_read < 0.1:
+            return
+        self._subscriptions_read = now
+        with self.socket_lock:
+            while self.socket.poll(0):
+                event = self.socket.recv()
+                topic = event[1:]
+                if not topic.startswith(INV_TOPIC):
+                    continue
+                peer = topic[len(INV_TOPIC) :].decode()
+                if event[0] == 1:
+                    self.subscribers.add(peer)
+                else:
+                    self.subscribers.discard(peer)
+
+    def reading_network(self):
+        while self._running:
+            try:
+                self.read_subscriptions()
+                if not self.socket_sub.poll(100):
+                    continue
+                frames = self.socket_sub.recv_multipart()
+                # an inv message comes after its topic
+                data = frames[-1]
+                self.gossip_bytes_received += sum(map(len, frames))
+                self.gossip_messages_received += 1
+                if not self.inbound.put(data):
+                    logging.warning("Message SHED: inbound queue is full.")
+            except:
+                traceback.print_exc()
+
+    def handle_message(self, data: bytes):
+        self.handle(json.loads(data))
+
+    def handle(self, data: dict):
+        if "operation" not in data:
+            return
+        metrics.inc(f"messages.{data['operation']}")
+        parameters = data["parameters"]
+        if data["operation"] == "add_transaction":
+            if not self.tx_pipeline.submit(parameters):
+                logging.warning("Transaction SHED: pipeline is full.")
+        elif data["operation"] == "inv":
+            if self.relay is not None:
+                self.relay.on_inv(parameters)
+        elif data["operation"] == "add_peer":
+            if self.add_peer(Blockchain.from_dict(parameters["blockchain"])):
+                # the peers that miss this chain catch up in turn
+                self.publish_block(self.blockchain.head)
+        elif data["operation"] == "add_block":
+            self.add_block(parameters)
+        elif data["operation"] == "cmpct_block":
+            self.add_compact_block(parameters)
+
+    def trusts_start(self, blockchain: Blockchain) -> bool:
+        # the blocks of a peer chain that cannot be re-hashed, a snapshot
+        # start or pruned blocks, are only adopted when this node already
+        # has them. Their pruned state is then taken from this node's chain.
+        if blockchain.pruned_height > blockchain.head.index:
+            return False
+        start = blockchain.blocks[0]
+        if start.index == 0 and blockchain.pruned_height == 0:
+            return True
+        if self.blockchain is None:
+            return False
+        last = blockchain.block_at(
+            max(start.index, blockchain.pruned_height - 1)
+        )
+        return (
+            last is not None
+            and self.blockchain.contains(last)
+            and blockchain.adopt_pruned_state(self.blockchain)
+        )
+
+    def replace_chain(self, new_blockchain: Blockchain):
+        if self.blockchain is not None:
+            new_blockchain.restore_history(self.blockchain)
+            new_blockchain.restore_bodies(self.blockchain)
+        with self.chain_lock:
+            old_blockchain = self.blockchain
+            # the index follows the reorg: only the blocks above the fork
+            # point are disconnected and connected
+            if self.indexed and new_blockchain.indexer is None:
+                if old_blockchain is None or not new_blockchain.take_index(
+                    old_blockchain
+                ):
+                    new_blockchain.enable_index()
+            if self.prune_depth is not None:
+                new_blockchain.prune(self.prune_depth)
+            # an extension of the current chain is not a reorg
+            if old_blockchain is not None and not new_blockchain.contains(
+                old_blockchain.head
+            ):
+                metrics.inc("chain.reorgs")
+            self.blockchain = new_blockchain
+        self.update_chain_gauges()
+        self.notify_block(new_blockchain.head)
+
+    def add_block(self, parameters):
+        new_block = Block.from_dict(parameters["block"])
+        if self.blockchain is None:
+            self.catch_up()
+            return
+
+        if new_block not in self.blockchain.blocks:
+            self.accept_block(new_block)
+
+    def accept_block(self, new_block: Block) -> bool:
+        if not new_block.verify():
+            logging.warning("Block REJECTED: Basic verification failed.")
+            logging.warning(f"Block was {new_block}.")
+            return False
+        with self.chain_lock:
+            result = self.blockchain.add_block_from_peer(new_block)
+            if result:
+                self.prune_chain()
+        self.update_chain_gauges()
+        self.notify_block(self.blockchain.head)
+
+        if not result:
+            logging.warning("A block from peer was discarded.")
+            if new_block.index > self.blockchain.head.index:
+                # the peer is ahead of this node
+                self.catch_up()
+            return False
+        logging.warning(f"A block from peer was added: {result}")
+        self.publish_block(new_block)
+        return True
+
+    def publish_block(self, block: Block):
+        if not self.compact_blocks:
+            self.publish(
+                {
+                    "operation": "add_block",
+                    "parameters": {"block": RawJSON(block.to_json())},
+                }
+            )
+            return
+        self.publish(
+            {
+                "operation": "cmpct_block",
+                "parameters": {
+                    "block": CompactBlock.from_block(block).to_dict(),
+                    "sender": self.address,
+                },
+            }
+        )
+
+    def add_compact_block(self, parameters):
+        # rebuilds the block from the pool, only the transactions missing
+        # from it are requested from the sender
+        if self.blockchain is None:
+            self.catch_up()
+            return
+
+        compact = CompactBlock.from_dict(parameters["block"])
+        if self.find_block(hashval=compact.hashval) is not None:
+            return
+        if compact.header["index"] > self.blockchain.head.index + 1:
+            # not worth rebuilding, it cannot be connected
+            self.catch_up()
+            return
+        with self.chain_lock:
+            pool = self.blockchain.pool_by_txid()
+        transactions, missing = compact.reconstruct(pool)
+        metrics.inc("compact.blocks")
+        metrics.inc("compact.missing_transactions", len(missing))
+        if not missing:
+            self.accept_compact_block(compact, transactions, parameters)
+            return
+
+        def fill(reply: Future):
+            try:
+                fetched = reply.result()
+                for position, data in zip(missing, fetched):
+                    transactions[position] = Transaction.from_dict(data)
+            except Exception as error:
+                logging.warning(
+                    f"Missing transactions fetch failed: {error!r}"
+                )
+            self.accept_compact_block(compact, transactions, parameters)
+
+        self.rpc.request_any(
+            self.block_sources(parameters["sender"]),
+            "get_block_transactions",
+            {"hash": compact.hashval, "positions": missing},
+        ).add_done_callback(
+            lambda reply: self.sync_executor.submit(fill, reply)
+        )
+
+    def accept_compact_block(
+        self,
+        compact: CompactBlock,
+        transactions: List[Optional[Transaction]],
+        parameters: dict,
+    ):
+        if None not in transactions:
+            new_block = compact.to_block(transactions)
+            # a short id collision shows up as a hash mismatch
+            if new_block.compute_hash() == new_block.hashval:
+                self.accept_block(new_block)
+                return
+
+        metrics.inc("compact.full_fallback")
+        logging.warning("Compact block not rebuilt, fetching it in full.")
+        self.fetch_block(
+            self.block_sources(parameters["sender"]), hashval=compact.hashval
+        ).add_done_callback(
+            lambda reply: self.sync_executor.submit(
+                self.accept_fetched_block, reply
+            )
+        )
+
+    def accept_fetched_block(self, reply: Future):
+        try:
+            new_block = reply.result()
+        except Exception as error:
+            logging.warning(f"Block fetch failed: {error!r}")
+            return
+        if new_block is not None and new_block not in self.blockchain.blocks:
+            self.accept_block(new_block)
+
+    def admit_transaction(self, new_transaction: Transaction, raw: dict):
+        with self.chain_lock:
+            if self.blockchain is None or self.blockchain.in_pool(
+                new_transaction
+            ):
+                return False
+            self.blockchain.add_transaction(transaction=new_transaction)
+        self.update_chain_gauges()
+        self.relay_transaction(new_transaction, raw)
+        self.notify_transaction(new_transaction)
+        return True
+
+    def relay_transaction(self, transaction: Transaction, raw: dict):
+        if self.relay is not None:
+            self.relay.announce(transaction.txid, raw)
+            return
+        self.publish(
+            {
+                "operation": "add_transaction",
+                "parameters": {
+                    "transaction": raw,
+                },
+            }
+        )
+
+    def add_peer(self, new_blockchain: Blockchain):
+        if not self.trusts_start(new_blockchain):
+            logging.error("Chain does not start at a known block.")
+            return False
+        if (
+            self.blockchain is None
+            or new_blockchain.head.index >= self.blockchain.head.index
+        ):  # Pseudo-consensus
+            # the first block, a genesis or a snapshot block checked by
+            # trusts_start, is the base of the replay
+            validated_blockchain = Blockchain(
+                self.difficulty,
+                blocks=new_blockchain.blocks[:1],
+                pruned_height=new_blockchain.pruned_height,
+                pruned_balances=new_blockchain.pruned_balances,
+            )
+            if self.validator is not None:
+                # the validator checks the links the replay below checks
+                validated_blockchain.blocks = list(new_blockchain.blocks)
+            else:
+                for block in new_blockchain.blocks[1:]:
+                    if not validated_blockchain.add_block_from_peer(block):
+                        logging.error("Bad blockchain. No peer added.")
+                        return False
+
+            if not self.chain_is_valid(validated_blockchain):
+                logging.error("Bad blockchain. No peer added.")
+                return False
+
+            self.replace_chain(validated_blockchain)
+            return True
+        return False
+
+    def sync_from(self, peer: str) -> "Future[bool]":
+        # download the chain of one peer and adopt it if it is longer
+        synced: "Future[bool]" = Future()
+
+        def adopt(data):
+            return data is not None and self.add_peer(
+                Blockchain.from_dict(data)
+            )
+
+        def validate(reply: Future):
+            try:
+                synced.set_result(adopt(reply.result()))
+            except Exception as error:
+                logging.warning(f"Sync from {peer} failed: {error!r}")
+                synced.set_result(False)
+
+        self.rpc.request(peer, "get_chain").add_done_callback(
+            lambda reply: self.sync_executor.submit(validate, reply)
+        )
+        return synced
+
+    def bootstrap(
+        self, peer: str, trusted: Optional[Iterable[str]] = None
+    ) -> "Future[bool]":
+        # starts from the snapshot of a peer, its history is downloaded and
+        # checked in the background afterwards
+        imported: "Future[bool]" = Future()
+
+        def adopt(reply: Future):
+            try:
+                data = reply.result()
+                imported.set_result(
+                    data is not None
+                    and self.import_snapshot(Snapshot.from_dict(data), trusted)
+                )
+            except Exception as error:
+                logging.warning(f"Bootstrap from {peer} failed: {error!r}")
+                imported.set_result(False)
+                return
+            if imported.result():
+                self.verify_history(peer).add_done_callback(dropped)
+
+        def dropped(verified: Future):
+            # the node does not keep running on an unverified snapshot
+            if not verified.result():
+                self.drop_snapshot()
+
+        self.rpc.request(peer, "get_snapshot").add_done_callback(
+            lambda reply: self.sync_executor.submit(adopt, reply)
+        )
+        return imported
+
+    def import_snapshot(
+        self, snapshot: Snapshot, trusted: Optional[Iterable[str]] = None
+    ) -> bool:
+        if not snapshot.verify():
+            return False
+        if trusted is not None and snapshot.signer not in trusted:
+            logging.warning(f"Snapshot signer {snapshot.signer} not trusted.")
+            return False
+        if (
+            self.blockchain is not None
+            and self.blockchain.head.index >= snapshot.height
+        ):
+            logging.info("Snapshot is not ahead of the chain.")
+            return False
+        self.snapshot = snapshot
+        self.snapshot_chain = snapshot.to_blockchain()
+        self.pre_snapshot = self.blockchain
+        self.replace_chain(self.snapshot_chain)
+        metrics.inc("snapshot.imported")
+        # the signer does not vouch for the pool: its transactions are
+        # checked like the ones from the peers
+        for raw in snapshot.tx_pool:
+            if not self.tx_pipeline.submit({"transaction": raw}):
+                logging.warning("Transaction SHED: pipeline is full.")
+        return True
+
+    def clear_snapshot(self):
+        self.snapshot = None
+        self.snapshot_chain = None
+        self.pre_snapshot = None
+
+    def export_snapshot(self, pathfile: str = "snapshot.json"):
+        with self.chain_lock:
+            snapshot = Snapshot.take(self.blockchain)
+        snapshot.sign(self.wallet)
+        snapshot.to_jsonfile(pathfile)
+
+    def verify_history(self, peer: str) -> "Future[bool]":
+        # downloads the full chain of `peer` and checks that it leads to the
+        # imported snapshot before putting it below the snapshot block
+        verified: "Future[bool]" = Future()
+
+        def check(data) -> bool:
+            snapshot = self.snapshot
+            if snapshot is None or data is None:
+                return False
+            history = Blockchain.from_dict(data)
+            block = history.block_at(snapshot.height)
+            if (
+                history.blocks[0].index != 0
+                or block is None
+                or block.hashval != snapshot.header["hashval"]
+                or not self.chain_is_valid(history)
+                or history.balances(snapshot.height) != snapshot.balances
+            ):
+                logging.error(f"Snapshot history from {peer} is not valid.")
+                metrics.inc("snapshot.rejected")
+                return False
+            with self.chain_lock:
+                if self.blockchain is not self.snapshot_chain:
+                    # already replaced by a chain checked in full
+                    self.clear_snapshot()
+                    return True
+                if not self.blockchain.restore_history(history):
+                    return False
+                self.prune_chain()
+                self.clear_snapshot()
+            metrics.inc("snapshot.verified")
+            return True
+
+        def validate(reply: Future):
+            try:
+                verified.set_result(check(reply.result()))
+            except Exception as error:
+                logging.warning(f"History from {peer} failed: {error!r}")
+                verified.set_result(False)
+
+        self.rpc.request(peer, "get_chain", timeout=60.0).add_done_callback(
+            lambda reply: self.sync_executor.submit(validate, reply)
+        )
+        return verified
+
+    def drop_snapshot(self):
+        # the history did not lead to the imported snapshot: the chain held
+        # before the import comes back and the peers are asked for theirs.
+        # A chain adopted since then is kept, and so is the snapshot chain
+        # when there was none before: the peers replace it.
+        with self.chain_lock:
+            if self.snapshot is None:
+                return
+            dropped = (
+                self.blockchain is self.snapshot_chain
+                and self.pre_snapshot is not None
+            )
+            if dropped:
+                self.blockchain = self.pre_snapshot
+                if self.indexed and self.blockchain.indexer is None:
+                    self.blockchain.enable_index()
+            self.clear_snapshot()
+        if dropped:
+            logging.warning("Unverified snapshot dropped.")
+            metrics.inc("snapshot.dropped")
+            self.update_chain_gauges()
+        self.catch_up()
+
+    def block_sources(self, sender: str) -> List[str]:
+        # the sender reports its own address, which may not be reachable
+        # from here: the peers this node is connected to come next
+        return [sender] + sorted(self.peers - {sender})
+
+    def fetch_block(
+        self,
+        peers: Sequence[str],
+        height: Optional[int] = None,
+        hashval: Optional[str] = None,
+    ) -> "Future[Optional[Block]]":
+        return map_future(
+            self.rpc.request_any(
+                peers, "get_block", {"height": height, "hash": hashval}
+            ),
+            lambda data: None if data is None else Block.from_dict(data),
+        )
+
+    def query_head(self, peer: str) -> Future:
+        return self.rpc.request(peer, "get_head")
+
+    def find_block(
+        self, height: Optional[int] = None, hashval: Optional[str] = None
+    ) -> Optional[Block]:
+        blockchain = self.blockchain
+        if blockchain is None:
+            return None
+        if height is not None:
+            return blockchain.block_at(height)
+        for block in reversed(blockchain.blocks):
+            if block.hashval == hashval:
+                return block
+        return None
+
+    def rpc_get_chain(self, params):
+        blockchain = self.blockchain
+        return None if blockchain is None else RawJSON(blockchain.to_json())
+
+    def rpc_get_head(self, params):
+        blockchain = self.blockchain
+        if blockchain is None:
+            return None
+        return {
+            "height": blockchain.head.index,
+            "hash": blockchain.head.hashval,
+            "pool": len(blockchain.tx_pool),
+            "peers": len(self.peers),
+            # older blocks cannot be served with their transactions
+            "pruned_height": blockchain.pruned_height,
+        }
+
+    def rpc_get_headers(self, params):
+        # served to light clients, which re-hash the headers, pruned blocks
+        # included: the header holds the root of the transactions
+        blockchain = self.blockchain
+        if blockchain is None:
+            return []
+        start = int(params["start"])
+        count = min(int(params.get("count", MAX_HEADERS)), MAX_HEADERS)
+        headers = []
+        for height in range(start, start + count):
+            block = blockchain.block_at(height)
+            if block is None:
+                break
+            headers.append(Header.from_block(block).to_dict())
+        return headers
+
+    def rpc_get_block(self, params):
+        block = self.find_block(params.get("height"), params.get("hash"))
+        if block is None:
+            return None
+        if self.blockchain.is_pruned(block):
+            raise LookupError(f"Block {block.index} is pruned")
+        return RawJSON(block.to_json())
+
+    def rpc_get_block_transactions(self, params):
+        block = self.find_block(hashval=params["hash"])
+        if block is None:
+            raise KeyError(f"Unknown block {params['hash']}")
+        if self.blockchain.is_pruned(block):
+            raise LookupError(f"Block {block.index} is pruned")
+        return [
+            block.transactions[position].to_dict()
+            for position in params["positions"]
+        ]
+
+    def rpc_get_transaction(self, params):
+        blockchain = self.blockchain
+        if blockchain is None:
+            return None
+        position = blockchain.transaction_position(params["txid"])
+        if position is None:
+            return None
+        height, tx_number = position
+        block = blockchain.block_at(height)
+        return {
+            "height": height,
+            "transaction": block.transactions[tx_number].to_dict(),
+            # proves the transaction to light clients, see LightClient
+            "branch": block.merkle_branch(tx_number),
+        }
+
+    def rpc_get_history(self, params):
+        blockchain = self.blockchain
+        if blockchain is None:
+            return []
+        return [
+            transaction.to_dict()
+            for transaction in blockchain.address_history(params["address"])
+        ]
+
+    def rpc_get_snapshot(self, params):
+        blockchain = self.blockchain
+        if blockchain is None:
+            return None
+        # signed once per head, the pool it carries may lag behind
+        with self.chain_lock:
+            snapshot = self.served_snapshot
+            if (
+                snapshot is None
+                or snapshot.header["hashval"] != blockchain.head.hashval
+            ):
+                snapshot = Snapshot.take(blockchain)
+                snapshot.sign(self.wallet)
+                self.served_snapshot = snapshot
+        return snapshot.to_dict()
+
+    def announce(self):
+        if self.blockchain is not None:
+            self.publish(
+                {
+                    "operation": "add_peer",
+                    "parameters": {
+                        "address": self.wallet.to_address(),
+                        "blockchain": RawJSON(self.blockchain.to_json()),
+                        "pruned_height": self.blockchain.pruned_height,
+                    },
+                }
+            )
+
+    def submit_transaction(self, transaction: Transaction):
+        with self.chain_lock:
+            self.blockchain.add_transaction(transaction)
+        self.update_chain_gauges()
+        self.notify_transaction(transaction)
+        self.relay_transaction(transaction, transaction.to_dict())
+
+    def mine(self) -> "Future[Optional[Block]]":
+        # resolves once the consensus round that follows mining is over
+        mined: "Future[Optional[Block]]" = Future()
+
+        if self.blockchain is None:
+
+            def create(_):
+                if self.blockchain is None:
+                    with self.chain_lock:
+                        self.blockchain = Blockchain.create(
+                            self.difficulty, self.wallet
+                        )
+                        if self.indexed:
+                            self.blockchain.enable_index()
+                    self.update_chain_gauges()
+                    self.notify_block(self.blockchain.head)
+                mined.set_result(None)
+
+            self.request_consensus().add_done_callback(create)
+            return mined
+
+        with self.chain_lock:
+            result = self.blockchain.mine_block(
+                self.wallet, self.template_builder
+            )
+        if not result:
+            self.update_chain_gauges()
+            logging.info("No transaction to mine")
+            mined.set_result(None)
+            return mined
+        return self.commit_mined_block(result)
+
+    def submit_block(
+        self, block: Block
+    ) -> "Optional[Future[Optional[Block]]]":
+        # a block mined out of the node, e.g. by the miners of the work
+        # server, on top of the current head. None if it is rejected.
+        with self.chain_lock:
+            result = self.blockchain.add_mined_block(block, self.wallet)
+        if not result:
+            return None
+        return self.commit_mined_block(result)
+
+    def commit_mined_block(self, result: Block) -> "Future[Optional[Block]]":
+        mined: "Future[Optional[Block]]" = Future()
+        self.prune_chain()
+        self.update_chain_gauges()
+        chain_length = len(self.blockchain.blocks)
+
+        def broadcast(_):
+            if chain_length == len(self.blockchain.blocks):
+                self.publish_block(self.blockchain.head)
+            self.notify_block(self.blockchain.head)
+            mined.set_result(result)
+
+        self.request_consensus().add_done_callback(broadcast)
+        return mined
+
+    def chain_is_valid(self, blockchain: Blockchain) -> bool:
+        if self.validator is not None:
+            return self.validator.validate(blockchain)
+        return blockchain.is_valid()
+
+    def prune_chain(self):
+        if self.prune_depth is not None:
+            with self.chain_lock:
+                self.blockchain.prune(self.prune_depth)
+
+    def request_consensus(
+        self,
+        quorum: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> "Future[ConsensusRound]":
+        # asks the peers for their head over RPC. Once `quorum` peers
+        # (default: all known peers) answered, or after `timeout` seconds,
+        # the chain is downloaded from the peer with the highest head if it
+        # is ahead of this node, then the round finishes.
+        peers = sorted(self.peers)
+        if quorum is None:
+            quorum = self.consensus_quorum
+        if quorum is None or quorum > len(peers):
+            quorum = len(peers)
+        if timeout is None:
+            timeout = self.consensus_timeout
+
+        consensus_round = ConsensusRound(uuid.uuid4().hex, quorum)
+        if quorum == 0:
+            consensus_round.future.set_result(consensus_round)
+            return consensus_round.future
+
+        with self.consensus_lock:
+            self.consensus_rounds[consensus_round.request_id] = consensus_round
+        consensus_round.timer = threading.Timer(
+            timeout, self.consensus_timed_out, [consensus_round.request_id]
+        )
+        consensus_round.timer.daemon = True
+        consensus_round.timer.start()
+
+        for peer in peers:
+            self.query_head(peer).add_done_callback(
+                partial(
+                    self.consensus_answered, consensus_round.request_id, peer
+                )
+            )
+        return consensus_round.future
+
+    def consensus_answered(self, request_id: str, peer: str, reply: Future):
+        try:
+            head = reply.result()
+        except Exception as error:
+            logging.info(f"Head query to {peer} failed: {error!r}")
+            return
+        with self.consensus_lock:
+            consensus_round = self.consensus_rounds.get(request_id)
+            if consensus_round is None:
+                return
+            consensus_round.responders.add(peer)
+            consensus_round.heads[peer] = head
+            if len(consensus_round.responders) < consensus_round.quorum:
+                return
+            del self.consensus_rounds[request_id]
+        consensus_round.timer.cancel()
+        self.finish_consensus(consensus_round)
+
+    def consensus_timed_out(self, request_id: str):
+        with self.consensus_lock:
+            consensus_round = self.consensus_rounds.pop(request_id, None)
+        if consensus_round is None:
+            return
+        logging.info(
+            f"Consensus round timed out with "
+            f"{len(consensus_round.responders)}/{consensus_round.quorum} "
+            f"answers."
+        )
+        consensus_round.timed_out = True
+        self.finish_consensus(consensus_round)
+
+    def finish_consensus(self, consensus_round: ConsensusRound):
+        # only the chain of the best peer is downloaded
+        height = -1 if self.blockchain is None else self.blockchain.head.index
+        best = None
+        for peer, head in sorted(consensus_round.heads.items()):
+            if head is not None and head["height"] > height:
+                best, height = peer, head["height"]
+        if best is None:
+            consensus_round.future.set_result(consensus_round)
+            return
+
+        def synced(reply: Future):
+            if reply.result():
+                # the peers behind this node catch up in turn
+                self.publish_block(self.blockchain.head)
+            consensus_round.future.set_result(consensus_round)
+
+        self.sync_from(best).add_done_callback(synced)
+
+    def catch_up(self):
+        # this node is behind or has no chain: one round at a time
+        with self.consensus_lock:
+            if self.catching_up:
+                return
+            self.catching_up = True
+
+        def done(_):
+            self.catching_up = False
+
+        self.request_consensus().add_done_callback(done)
+
+    def notify_block(self, block: Block):
+        for callback in self.on_block:
+            callback(block)
+
+    def notify_transaction(self, transaction: Transaction):
+        for callback in self.on_transaction:
+            callback(transaction)
+
+    def update_chain_gauges(self):
+        if metrics.enabled and self.blockchain is not None:
+            metrics.set_gauge("chain.height", self.blockchain.head.index)
+            metrics.set_gauge("pool.size", len(self.blockchain.tx_pool))
+            metrics.set_gauge(
+                "chain.pruned_height", self.blockchain.pruned_height
+            )
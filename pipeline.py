@@ -0,0 +1,207 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from transaction import Transaction
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    rejected: int = 0
+    shed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["mean_latency"] = (
+            self.total_latency / self.processed if self.processed else 0.0
+        )
+        data["mean_wait"] = (
+            self.total_wait / self.processed if self.processed else 0.0
+        )
+        return data
+
+
+class PipelineStage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        workers: int = 1,
+        maxsize: int = 1000,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: "queue.Queue" = queue.Queue(maxsize)
+        self.next_stage: Optional["PipelineStage"] = None
+        self.stats = StageStats()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def put(self, item: Any) -> bool:
+        try:
+            self.queue.put_nowait((time.perf_counter(), item))
+        except queue.Full:
+            with self._lock:
+                self.stats.shed += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            enqueued, item = entry
+            started = time.perf_counter()
+            try:
+                result = self.handler(item)
+            except Exception:
+                logging.exception(f"Pipeline stage {self.name} failed.")
+                result = None
+            latency = time.perf_counter() - started
+
+            with self._lock:
+                self.stats.processed += 1
+                self.stats.total_wait += started - enqueued
+                self.stats.max_wait = max(
+                    self.stats.max_wait, started - enqueued
+                )
+                self.stats.total_latency += latency
+                self.stats.max_latency = max(self.stats.max_latency, latency)
+                if result is None:
+                    self.stats.rejected += 1
+
+            if result is not None and self.next_stage is not None:
+                self.next_stage.put(result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data = self.stats.to_dict()
+        data["depth"] = self.queue.qsize()
+        return data
+
+
+class TransactionPipeline:
+    def __init__(
+        self,
+        admit: Callable[[Transaction, dict], bool],
+        verify_workers: int = 4,
+        queue_size: int = 10000,
+        known_capacity: int = 100000,
+    ):
+        self.admit = admit
+        self.known_capacity = known_capacity
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._known_lock = threading.Lock()
+
+        self.stages = [
+            PipelineStage("decode", self._decode, maxsize=queue_size),
+            PipelineStage("check", self._check, maxsize=queue_size),
+            PipelineStage(
+                "verify",
+                self._verify,
+                workers=verify_workers,
+                maxsize=queue_size,
+            ),
+            PipelineStage("admit", self._admit, maxsize=queue_size),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def submit(self, parameters: dict) -> bool:
+        return self.stages[0].put(parameters)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.snapshot() for stage in self.stages}
+
+    def is_known(self, signature: Optional[str]) -> bool:
+        with self._known_lock:
+            return signature in self._known
+
+    def remember(self, signature: str):
+        with self._known_lock:
+            self._known[signature] = None
+            self._known.move_to_end(signature)
+            while len(self._known) > self.known_capacity:
+                self._known.popitem(last=False)
+
+    @staticmethod
+    def _decode(parameters: dict):
+        try:
+            raw = parameters["transaction"]
+            return Transaction.from_dict(raw), raw
+        except (KeyError, TypeError, ValueError):
+            logging.warning("Transaction REJECTED: Malformed transaction.")
+            return None
+
+    def _check(self, item):
+        transaction, raw = item
+        if (
+            transaction.sender == "NETWORK_ADMIN"
+            or not transaction.sender
+            or not transaction.receiver
+            or transaction.amount < 0
+            or transaction.signature is None
+        ):
+            logging.warning("Transaction REJECTED: Stateless check failed.")
+            logging.warning(f"Transaction was {transaction}.")
+            return None
+        # already admitted: do not pay for the signature check again
+        if self.is_known(transaction.signature):
+            return None
+        return item
+
+    @staticmethod
+    def _verify(item):
+        transaction, _ = item
+        try:
+            valid = transaction.verify()
+        except Exception:
+            valid = False
+        if not valid:
+            logging.warning("Transaction REJECTED: Basic verification failed.")
+            logging.warning(f"Transaction was {transaction}.")
+            return None
+        return item
+
+    def _admit(self, item):
+        transaction, raw = item
+        if self.is_known(transaction.signature):
+            return None
+        if not self.admit(transaction, raw):
+            return None
+        self.remember(transaction.signature)
+        return item
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Set
+
+from metrics import metrics
+from rpc import RpcClient
+
+# topic of the inv messages, followed by the address of their recipient
+INV_TOPIC = b"inv "
+
+
+class InventoryRelay:
+    # announces transaction ids in batches (inv) and fetches the bodies a
+    # node lacks from the announcing peer in one request (getdata). A peer is
+    # not told about the transactions it announced itself.
+    def __init__(
+        self,
+        address: str,
+        publish_to: Callable[[str, dict], None],
+        subscribers: Callable[[], Set[str]],
+        rpc: RpcClient,
+        submit: Callable[[dict], bool],
+        interval: float = 0.1,
+        batch_size: int = 500,
+        cache_size: int = 50000,
+        request_timeout: float = 5.0,
+    ):
+        self.address = address
+        self.publish_to = publish_to
+        self.subscribers = subscribers
+        self.rpc = rpc
+        self.submit = submit
+        self.interval = interval
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.request_timeout = request_timeout
+
+        # bodies of the transactions this node accepted, served to peers
+        self.cache: "OrderedDict[str, dict]" = OrderedDict()
+        # peers known to have a transaction: they announced it or were told
+        self.known: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self.queue: List[str] = []
+        self.requested: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="inv-relay", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def has(self, txid: str) -> bool:
+        with self._lock:
+            return txid in self.cache
+
+    def announce(self, txid: str, raw: dict):
+        with self._lock:
+            if txid in self.cache:
+                return
+            self.cache[txid] = raw
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.queue.append(txid)
+
+    def learn(self, txid: str, peer: str):
+        # called with the lock held
+        peers = self.known.get(txid)
+        if peers is None:
+            peers = self.known[txid] = set()
+            while len(self.known) > self.cache_size:
+                self.known.popitem(last=False)
+        peers.add(peer)
+
+    def flush(self):
+        now = time.monotonic()
+        with self._lock:
+            queue, self.queue = self.queue, []
+            self.requested = {
+                txid: deadline
+                for txid, deadline in self.requested.items()
+                if deadline >= now
+            }
+        if not queue:
+            return
+        for peer in sorted(self.subscribers()):
+            with self._lock:
+                txids = [
+                    txid
+                    for txid in queue
+                    if peer not in self.known.get(txid, ())
+                ]
+                for txid in txids:
+                    self.learn(txid, peer)
+            metrics.inc("relay.inv_suppressed", len(queue) - len(txids))
+            for start in range(0, len(txids), self.batch_size):
+                self.publish_to(
+                    peer,
+                    {
+                        "operation": "inv",
+                        "parameters": {
+                            "sender": self.address,
+                            "txids": txids[start : start + self.batch_size],
+                        },
+                    },
+                )
+                metrics.inc("relay.inv_sent")
+
+    def on_inv(self, parameters: dict):
+        now = time.monotonic()
+        with self._lock:
+            for txid in parameters["txids"]:
+                self.learn(txid, parameters["sender"])
+            missing = [
+                txid
+                for txid in parameters["txids"]
+                if txid not in self.cache and self.requested.get(txid, 0) < now
+            ]
+            for txid in missing:
+                self.requested[txid] = now + self.request_timeout
+        if not missing:
+            return
+
+        metrics.inc("relay.getdata_requested", len(missing))
+        self.rpc.request(
+            parameters["sender"],
+            "getdata",
+            {"txids": missing},
+            timeout=self.request_timeout,
+        ).add_done_callback(lambda reply: self._received(missing, reply))
+
+    def _received(self, txids: List[str], reply: Future):
+        try:
+            transactions = reply.result()
+        except Exception as error:
+            logging.warning(f"getdata failed: {error!r}")
+            transactions = {}
+        for raw in transactions.values():
+            if not self.submit({"transaction": raw}):
+                logging.warning("Transaction SHED: pipeline is full.")
+        with self._lock:
+            # not received: another announcer may be asked
+            for txid in txids:
+                if txid not in transactions:
+                    self.requested.pop(txid, None)
+
+    def getdata(self, params: Dict[str, Any]) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                txid: self.cache[txid]
+                for txid in params["txids"]
+                if txid in self.cache
+            }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -0,0 +1,296 @@
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import zmq
+from zmq.sugar.socket import Socket
+
+# the request channel of a node listens next to its PUB port
+RPC_PORT_OFFSET = 1000
+
+
+def rpc_address(peer: str) -> str:
+    host, port = peer.rsplit(":", 1)
+    return f"{host}:{int(port) + RPC_PORT_OFFSET}"
+
+
+class RpcError(Exception):
+    pass
+
+
+class RawJSON:
+    # a value already serialized, copied as it is by dumps
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def dumps(value: Any) -> str:
+    # json.dumps where the RawJSON values are spliced in instead of being
+    # encoded again. The placeholders carry a random token so that no
+    # string of `value` can be taken for one.
+    raw: List[str] = []
+    token = uuid.uuid4().hex
+
+    def placeholder(item: Any) -> str:
+        if not isinstance(item, RawJSON):
+            raise TypeError(f"{type(item).__name__} is not JSON serializable")
+        raw.append(item.text)
+        return f"{token}:{len(raw) - 1}"
+
+    text = json.dumps(value, default=placeholder)
+    if not raw:
+        return text
+    return re.sub(f'"{token}:(\\d+)"', lambda match: raw[int(match[1])], text)
+
+
+def map_future(future: Future, function: Callable[[Any], Any]) -> Future:
+    # runs on the thread resolving `future`: keep `function` cheap
+    mapped: Future = Future()
+
+    def done(source: Future):
+        try:
+            mapped.set_result(function(source.result()))
+        except Exception as error:
+            mapped.set_exception(error)
+
+    future.add_done_callback(done)
+    return mapped
+
+
+class RpcServer:
+    def __init__(
+        self,
+        context: zmq.Context,
+        endpoint: str,
+        handlers: Dict[str, Callable[[Any], Any]],
+    ):
+        self.handlers = handlers
+        # traffic of the requests and replies, see Node.bytes_sent
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.socket: Socket = context.socket(zmq.ROUTER)
+        self.socket.bind(endpoint)
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="rpc-server", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.socket.close(linger=0)
+
+    def _run(self):
+        while self._running:
+            try:
+                if not self.socket.poll(100):
+                    continue
+                identity, payload = self.socket.recv_multipart()
+                self.bytes_received += len(payload)
+                self.messages_received += 1
+                reply = dumps(self.dispatch(payload)).encode()
+                self.socket.send_multipart([identity, reply])
+                self.bytes_sent += len(reply)
+                self.messages_sent += 1
+            except Exception:
+                logging.exception("RPC server failed.")
+
+    def dispatch(self, payload: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(payload)
+        except ValueError:
+            return {"id": None, "error": "Malformed request."}
+        handler = self.handlers.get(request.get("method"))
+        if handler is None:
+            return {
+                "id": request.get("id"),
+                "error": f"Unknown method: {request.get('method')}",
+            }
+        try:
+            return {"id": request["id"], "result": handler(request["params"])}
+        except Exception as error:
+            logging.exception(f"RPC {request['method']} failed.")
+            return {"id": request.get("id"), "error": repr(error)}
+
+
+class RpcClient:
+    # one persistent DEALER socket per peer, owned by a single I/O thread.
+    # Requests are pipelined: many can be in flight on the same socket and
+    # replies are matched by id.
+    def __init__(self, context: zmq.Context, timeout: float = 5.0):
+        self.context = context
+        self.timeout = timeout
+        # updated by the I/O thread only
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.sockets: Dict[str, Socket] = {}
+        self.pending: Dict[int, Tuple[Future, float]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        # callers hand requests to the I/O thread through an inproc pipe
+        endpoint = f"inproc://rpc-client-{id(self)}"
+        self._inbox: Socket = context.socket(zmq.PULL)
+        self._inbox.bind(endpoint)
+        self._outbox: Socket = context.socket(zmq.PUSH)
+        self._outbox.connect(endpoint)
+
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="rpc-client", daemon=True
+        )
+        self._thread.start()
+
+    def request(
+        self,
+        peer: str,
+        method: str,
+        params: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Future:
+        future: Future = Future()
+        request_id = next(self._ids)
+        deadline = time.monotonic() + (
+            self.timeout if timeout is None else timeout
+        )
+        payload = json.dumps(
+            {"id": request_id, "method": method, "params": params}
+        ).encode()
+        with self._lock:
+            self.pending[request_id] = (future, deadline)
+            self._outbox.send_multipart([rpc_address(peer).encode(), payload])
+        return future
+
+    def call(
+        self,
+        peer: str,
+        method: str,
+        params: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        return self.request(peer, method, params, timeout).result()
+
+    def request_any(
+        self,
+        peers: Sequence[str],
+        method: str,
+        params: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Future:
+        # asks the peers in turn until one answers with something else than
+        # None, the last error is raised if none does
+        result: Future = Future()
+
+        def attempt(position: int, error: Optional[Exception]):
+            if position == len(peers):
+                result.set_exception(
+                    error or LookupError(f"No peer answered {method}.")
+                )
+                return
+
+            def done(reply: Future):
+                try:
+                    value = reply.result()
+                except Exception as failure:
+                    attempt(position + 1, failure)
+                    return
+                if value is None:
+                    attempt(position + 1, error)
+                else:
+                    result.set_result(value)
+
+            self.request(
+                peers[position], method, params, timeout
+            ).add_done_callback(done)
+
+        attempt(0, None)
+        return result
+
+    def forget(self, peer: str):
+        with self._lock:
+            self._outbox.send_multipart([rpc_address(peer).encode(), b""])
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        with self._lock:
+            self._outbox.close(linger=0)
+
+    def _socket(self, address: str) -> Socket:
+        socket = self.sockets.get(address)
+        if socket is None:
+            socket = self.context.socket(zmq.DEALER)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(f"tcp://{address}")
+            self.sockets[address] = socket
+        return socket
+
+    def _run(self):
+        poller = zmq.Poller()
+        poller.register(self._inbox, zmq.POLLIN)
+        while self._running:
+            for socket, _ in poller.poll(50):
+                if socket is self._inbox:
+                    address, payload = self._inbox.recv_multipart()
+                    address = address.decode()
+                    if payload:
+                        dealer = self._socket(address)
+                        poller.register(dealer, zmq.POLLIN)
+                        dealer.send(payload)
+                        self.bytes_sent += len(payload)
+                        self.messages_sent += 1
+                    elif address in self.sockets:
+                        dealer = self.sockets.pop(address)
+                        poller.unregister(dealer)
+                        dealer.close()
+                else:
+                    reply = socket.recv()
+                    self.bytes_received += len(reply)
+                    self.messages_received += 1
+                    self._resolve(json.loads(reply))
+            self._expire()
+
+        for socket in self.sockets.values():
+            socket.close()
+        self._inbox.close(linger=0)
+
+    def _resolve(self, reply: Dict[str, Any]):
+        with self._lock:
+            entry = self.pending.pop(reply.get("id"), None)
+        if entry is None:
+            return  # answered after its timeout
+        future, _ = entry
+        if "error" in reply:
+            future.set_exception(RpcError(reply["error"]))
+        else:
+            future.set_result(reply.get("result"))
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                request_id
+                for request_id, (_, deadline) in self.pending.items()
+                if deadline < now
+            ]
+            futures = [self.pending.pop(i)[0] for i in expired]
+        for future in futures:
+            future.set_exception(TimeoutError("RPC request timed out."))
@@ -0,0 +1,176 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from pipeline import StageStats
+
+# message classes by priority, the first one is handled first
+CLASSES: Dict[str, Tuple[str, ...]] = {
+    "block": ("add_block", "cmpct_block"),
+    "chain": ("add_peer",),
+    "transaction": ("add_transaction", "inv"),
+    "other": (),
+}
+_CLASS_OF = {
+    operation: name
+    for name, operations in CLASSES.items()
+    for operation in operations
+}
+# Node.publish writes the operation first
+_OPERATION = re.compile(rb'\{"operation": "(\w+)"')
+# and the address of the sender first in a chain announcement, see
+# Node.announce
+_SENDER = re.compile(rb'"parameters": \{"address": "(\w+)"')
+# classes where a message replaces the queued one of the same sender
+COALESCED = ("chain",)
+
+
+def classify(data: bytes) -> str:
+    # from the first bytes of the message, without decoding it
+    match = _OPERATION.match(data, 0, 64)
+    if match is None:
+        return "other"
+    return _CLASS_OF.get(match[1].decode("ascii"), "other")
+
+
+def sender_of(data: bytes) -> Optional[str]:
+    match = _SENDER.search(data, 0, 128)
+    if match is None:
+        return None
+    return match[1].decode("ascii")
+
+
+class InboundScheduler:
+    # queues the messages read from the peers by class and hands them to
+    # `handle` one at a time, blocks first. Transactions are shed when their
+    # queue is full or when they waited too long behind the other classes.
+    # The classes given an executor are handed to it instead, so that their
+    # slow messages do not hold the others back, one message at a time: the
+    # next one stays queued, where a newer message of the same sender
+    # replaces it (see COALESCED).
+    def __init__(
+        self,
+        handle: Callable[[bytes], Any],
+        transaction_queue_size: int = 10000,
+        transaction_max_wait: float = 5.0,
+        executors: Optional[Dict[str, Executor]] = None,
+    ):
+        self.handle = handle
+        self.executors = dict(executors or {})
+        # (enqueued, data, sender) entries, the sender of coalesced classes
+        self.queues: Dict[str, Deque[Tuple[float, bytes, Optional[str]]]] = {
+            name: deque() for name in CLASSES
+        }
+        # classes with a message in their executor
+        self.busy: Set[str] = set()
+        self.limits = {"transaction": transaction_queue_size}
+        self.max_waits = {"transaction": transaction_max_wait}
+        self.stats = {name: StageStats() for name in CLASSES}
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="inbound-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def put(self, data: bytes) -> bool:
+        name = classify(data)
+        sender = sender_of(data) if name in COALESCED else None
+        with self._condition:
+            queue = self.queues[name]
+            if sender is not None:
+                for position, (enqueued, _, queued) in enumerate(queue):
+                    if queued == sender:
+                        # keeps its place and wait, the older one is shed
+                        queue[position] = (enqueued, data, sender)
+                        self.stats[name].shed += 1
+                        return True
+            limit = self.limits.get(name)
+            if limit is not None and len(queue) >= limit:
+                self.stats[name].shed += 1
+                return False
+            queue.append((time.perf_counter(), data, sender))
+            self._condition.notify()
+        return True
+
+    def _next(self) -> Optional[Tuple[str, float, bytes]]:
+        with self._condition:
+            while self._running:
+                for name, queue in self.queues.items():
+                    if queue and name not in self.busy:
+                        enqueued, data, _ = queue.popleft()
+                        if name in self.executors:
+                            self.busy.add(name)
+                        return name, enqueued, data
+                self._condition.wait()
+        return None
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            name, enqueued, data = entry
+            executor = self.executors.get(name)
+            if executor is None:
+                self._process(name, enqueued, data)
+            else:
+                executor.submit(self._hand_off, name, enqueued, data)
+
+    def _hand_off(self, name: str, enqueued: float, data: bytes):
+        try:
+            self._process(name, enqueued, data)
+        finally:
+            with self._condition:
+                self.busy.discard(name)
+                self._condition.notify()
+
+    def _process(self, name: str, enqueued: float, data: bytes):
+        # the wait includes the time spent in the executor queue, behind the
+        # other tasks of the executor
+        started = time.perf_counter()
+        wait = started - enqueued
+        max_wait = self.max_waits.get(name)
+        if max_wait is not None and wait > max_wait:
+            with self._condition:
+                self.stats[name].shed += 1
+            return
+
+        try:
+            self.handle(data)
+        except Exception:
+            logging.exception(f"Inbound {name} message failed.")
+        latency = time.perf_counter() - started
+
+        with self._condition:
+            stats = self.stats[name]
+            stats.processed += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._condition:
+            data = {
+                name: stats.to_dict() for name, stats in self.stats.items()
+            }
+            for name, queue in self.queues.items():
+                # with the message in the executor
+                data[name]["depth"] = len(queue) + (name in self.busy)
+        return data
@@ -0,0 +1,502 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import zmq
+
+from chain import Blockchain
+from key import BitcoinAccount
+from node import Node
+from transaction import Transaction
+
+TOPOLOGIES = ["line", "ring", "star", "mesh", "random"]
+
+
+def topology_edges(
+    name: str, count: int, degree: int = 3, seed: int = 0
+) -> List[Tuple[int, int]]:
+    if name == "line":
+        return [(i, i + 1) for i in range(count - 1)]
+    if name == "ring":
+        edges = [(i, (i + 1) % count) for i in range(count)]
+        return edges if count > 2 else edges[: count - 1]
+    if name == "star":
+        return [(0, i) for i in range(1, count)]
+    if name == "mesh":
+        return [(i, j) for i in range(count) for j in range(i + 1, count)]
+    if name == "random":
+        # a random spanning tree keeps the graph connected, extra edges
+        # bring the mean degree up to `degree`
+        rng = random.Random(seed)
+        edges = {(rng.randrange(i), i) for i in range(1, count)}
+        while len(edges) < min(count * degree // 2, count * (count - 1) // 2):
+            i, j = sorted(rng.sample(range(count), 2))
+            edges.add((i, j))
+        return sorted(edges)
+    raise ValueError(f"Unknown topology: {name}")
+
+
+def summarize(values: Sequence[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": statistics.mean(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[int(0.95 * (len(ordered) - 1))],
+        "max": ordered[-1],
+    }
+
+
+class NodeRunner:
+    # runs a node and exposes the operations the harness needs, either
+    # directly (in-process) or behind a pipe (subprocess)
+    def __init__(
+        self,
+        port: int,
+        difficulty: int,
+        consensus_timeout: float,
+        seed: int,
+        inv_interval: float = 0.1,
+        compact_blocks: bool = True,
+        prune_depth: Optional[int] = None,
+        context: Optional[zmq.Context] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.wallet = BitcoinAccount(
+            self.rng.getrandbits(256).to_bytes(32, "big")
+        )
+        self.node = Node(
+            str(port),
+            self.wallet,
+            difficulty,
+            host="127.0.0.1",
+            bind_host="127.0.0.1",
+            context=context,
+            consensus_timeout=consensus_timeout,
+            inv_interval=inv_interval,
+            compact_blocks=compact_blocks,
+            prune_depth=prune_depth,
+        )
+        self.arrivals: Dict[str, float] = {}
+        # transactions per block, still known once a pruned node dropped them
+        self.sizes: Dict[str, int] = {}
+        self.pending: List[Transaction] = []
+        self.node.on_block.append(self._record_arrival)
+
+    def _record_arrival(self, block):
+        self.arrivals.setdefault(block.hashval, time.time())
+        self.sizes.setdefault(block.hashval, self._size(block))
+
+    @staticmethod
+    def _size(block) -> int:
+        return sum(
+            1
+            for transaction in block.transactions
+            if transaction.sender != "NETWORK_ADMIN"
+        )
+
+    def address(self) -> str:
+        return self.node.address
+
+    def wallet_address(self) -> str:
+        return self.wallet.to_address()
+
+    def start(self):
+        self.node.start()
+
+    def stop(self):
+        self.node.stop()
+
+    def connect(self, peer: str):
+        self.node.connect(peer)
+
+    def disconnect(self, peer: str):
+        self.node.disconnect(peer)
+
+    def create_chain(self):
+        self.node.blockchain = Blockchain.create(
+            self.node.difficulty, self.wallet
+        )
+        self._record_arrival(self.node.blockchain.head)
+
+    def announce(self):
+        self.node.announce()
+
+    def request_consensus(self):
+        self.node.request_consensus()
+
+    def prepare_transactions(self, count: int, receivers: List[str]):
+        # signing is done ahead of time so it does not limit the load
+        start = time.time()
+        for i in range(count):
+            transaction = Transaction(
+                self.wallet.to_address(),
+                self.rng.choice(receivers),
+                float(self.rng.randint(1, 1000)),
+                start + i * 1e-6,
+            )
+            transaction.sign(self.wallet)
+            self.pending.append(transaction)
+
+    def submit_pending(self, count: int) -> int:
+        if self.node.blockchain is None:
+            return 0
+        submitted = 0
+        while self.pending and submitted < count:
+            self.node.submit_transaction(self.pending.pop())
+            submitted += 1
+        return submitted
+
+    def mine(self) -> Optional[Tuple[str, float]]:
+        block = self.node.mine().result()
+        if block is None:
+            return None
+        return block.hashval, self.arrivals.get(block.hashval, time.time())
+
+    def block_arrivals(self) -> Dict[str, float]:
+        return dict(self.arrivals)
+
+    def committed(self, since_height: int) -> int:
+        blockchain = self.node.blockchain
+        if blockchain is None:
+            return 0
+        return sum(
+            self.sizes.get(block.hashval, self._size(block))
+            for block in blockchain.blocks[since_height + 1 :]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        blockchain = self.node.blockchain
+        return {
+            "address": self.node.address,
+            "height": None if blockchain is None else blockchain.head.index,
+            "head": None if blockchain is None else blockchain.head.hashval,
+            "pool": 0 if blockchain is None else len(blockchain.tx_pool),
+            "bytes_sent": self.node.bytes_sent,
+            "bytes_received": self.node.bytes_received,
+            "messages_sent": self.node.messages_sent,
+            "messages_received": self.node.messages_received,
+        }
+
+
+def _serve_runner(connection, kwargs):
+    logging.getLogger().setLevel(logging.ERROR)
+    runner = NodeRunner(**kwargs)
+    while True:
+        method, args = connection.recv()
+        if method is None:
+            runner.stop()
+            connection.send((True, None))
+            return
+        try:
+            connection.send((True, getattr(runner, method)(*args)))
+        except Exception as error:
+            connection.send((False, repr(error)))
+
+
+class ProcessNode:
+    def __init__(self, **kwargs):
+        spawn = multiprocessing.get_context("spawn")
+        self._connection, child = spawn.Pipe()
+        self._lock = threading.Lock()
+        self._process = spawn.Process(
+            target=_serve_runner, args=(child, kwargs), daemon=True
+        )
+        self._process.start()
+
+    def _call(self, method: Optional[str], *args):
+        with self._lock:
+            self._connection.send((method, args))
+            ok, result = self._connection.recv()
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def __getattr__(self, method: str):
+        return lambda *args: self._call(method, *args)
+
+    def stop(self):
+        self._call(None)
+        self._process.join()
+
+
+class Simulation:
+    def __init__(
+        self,
+        count: int,
+        topology: str = "ring",
+        degree: int = 3,
+        base_port: int = 7000,
+        difficulty: int = 2,
+        consensus_timeout: float = 1.0,
+        inv_interval: float = 0.1,
+        compact_blocks: bool = True,
+        prune_depth: Optional[int] = None,
+        processes: bool = False,
+        seed: int = 0,
+    ):
+        self.edges = topology_edges(topology, count, degree, seed)
+        self.rng = random.Random(seed)
+        self.context = None if processes else zmq.Context()
+        self.nodes = []
+        for i in range(count):
+            kwargs = dict(
+                port=base_port + i,
+                difficulty=difficulty,
+                consensus_timeout=consensus_timeout,
+                inv_interval=inv_interval,
+                compact_blocks=compact_blocks,
+                prune_depth=prune_depth,
+                seed=seed * 1000 + i,
+            )
+            if processes:
+                self.nodes.append(ProcessNode(**kwargs))
+            else:
+                self.nodes.append(NodeRunner(context=self.context, **kwargs))
+        self.addresses = [node.address() for node in self.nodes]
+        self.mined: Dict[str, Tuple[int, float]] = {}
+        self.started = time.time()
+
+    def start(self, timeout: float = 30.0) -> Optional[float]:
+        for node in self.nodes:
+            node.start()
+        self.link(self.edges)
+        time.sleep(0.5)  # let the subscriptions propagate
+
+        self.nodes[0].create_chain()
+        self.nodes[0].announce()
+        return self.wait_converged(timeout)
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+        if self.context is not None:
+            self.context.term()
+
+    def link(self, edges: Sequence[Tuple[int, int]]):
+        for i, j in edges:
+            self.nodes[i].connect(self.addresses[j])
+            self.nodes[j].connect(self.addresses[i])
+
+    def unlink(self, edges: Sequence[Tuple[int, int]]):
+        for i, j in edges:
+            self.nodes[i].disconnect(self.addresses[j])
+            self.nodes[j].disconnect(self.addresses[i])
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [node.stats() for node in self.nodes]
+
+    def wait_converged(
+        self, timeout: float, nodes: Optional[Sequence[int]] = None
+    ) -> Optional[float]:
+        indexes = range(len(self.nodes)) if nodes is None else nodes
+        start = time.time()
+        while time.time() - start < timeout:
+            heads = {self.nodes[i].stats()["head"] for i in indexes}
+            if len(heads) == 1 and None not in heads:
+                return time.time() - start
+            time.sleep(0.05)
+        return None
+
+    def mine_on(self, index: int):
+        result = self.nodes[index].mine()
+        if result is not None:
+            self.mined[result[0]] = (index, result[1])
+
+    def run_load(
+        self,
+        rate: float,
+        duration: float,
+        block_interval: float,
+        miners: Optional[Sequence[int]] = None,
+        mine_weights: Optional[Sequence[float]] = None,
+    ):
+        miners = list(range(len(self.nodes))) if miners is None else miners
+        senders = list(miners)
+        receivers = [self.nodes[i].wallet_address() for i in senders]
+        per_node = int(rate * duration / len(senders)) + 1
+        for i in senders:
+            self.nodes[i].prepare_transactions(per_node, receivers)
+
+        stop = threading.Event()
+
+        def inject():
+            tick = 0.05
+            budget = 0.0
+            while not stop.is_set():
+                budget += rate * tick
+                while budget >= 1:
+                    self.nodes[self.rng.choice(senders)].submit_pending(1)
+                    budget -= 1
+                time.sleep(tick)
+
+        injector = threading.Thread(target=inject, daemon=True)
+        injector.start()
+        end = time.time() + duration
+        while time.time() < end:
+            time.sleep(block_interval)
+            self.mine_on(self.rng.choices(miners, weights=mine_weights)[0])
+        stop.set()
+        injector.join()
+
+    def propagation(self) -> Dict[str, Any]:
+        latencies = []
+        arrivals = [node.block_arrivals() for node in self.nodes]
+        for hashval, (miner, mined_at) in self.mined.items():
+            for index, node_arrivals in enumerate(arrivals):
+                if index != miner and hashval in node_arrivals:
+                    latencies.append(node_arrivals[hashval] - mined_at)
+        return summarize(latencies)
+
+    def partition_and_heal(
+        self,
+        duration: float,
+        block_interval: float,
+        rate: float,
+        timeout: float = 30.0,
+    ) -> Dict[str, Any]:
+        half = len(self.nodes) // 2
+        left = list(range(half))
+        right = list(range(half, len(self.nodes)))
+        cut = [
+            (i, j)
+            for i, j in self.edges
+            if (i in left) != (j in left)  # an edge across the partition
+        ]
+        self.unlink(cut)
+        # the left side mines more often so that one fork is longer
+        self.run_load(
+            rate,
+            duration,
+            block_interval,
+            miners=left + right,
+            mine_weights=[2.0] * len(left) + [1.0] * len(right),
+        )
+        self.link(cut)
+        time.sleep(0.5)  # let the subscriptions propagate
+        start = time.time()
+        for node in self.nodes:
+            node.request_consensus()
+        converged = self.wait_converged(timeout)
+        return {
+            "cut_edges": len(cut),
+            "convergence": None if converged is None else time.time() - start,
+        }
+
+    def bandwidth(self, elapsed: float) -> List[Dict[str, Any]]:
+        return [
+            {
+                "address": stats["address"],
+                "bytes_sent": stats["bytes_sent"],
+                "bytes_received": stats["bytes_received"],
+                "sent_per_second": stats["bytes_sent"] / elapsed,
+                "received_per_second": stats["bytes_received"] / elapsed,
+            }
+            for stats in self.stats()
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring")
+    parser.add_argument("--degree", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=7000)
+    parser.add_argument("--difficulty", type=int, default=2)
+    parser.add_argument("--consensus-timeout", type=float, default=1.0)
+    parser.add_argument(
+        "--inv-interval",
+        type=float,
+        default=0.1,
+        help="transaction announce interval, 0 relays full bodies",
+    )
+    parser.add_argument(
+        "--full-blocks",
+        action="store_true",
+        help="relay blocks in full instead of compact blocks",
+    )
+    parser.add_argument(
+        "--prune",
+        type=int,
+        metavar="DEPTH",
+        help="nodes keep the transactions of the last DEPTH blocks only",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="run every node in its own process instead of a thread",
+    )
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--block-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--partition",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="split the network in two for SECONDS, then heal it",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this file")
+    options = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    simulation = Simulation(
+        options.nodes,
+        topology=options.topology,
+        degree=options.degree,
+        base_port=options.base_port,
+        difficulty=options.difficulty,
+        consensus_timeout=options.consensus_timeout,
+        inv_interval=options.inv_interval,
+        compact_blocks=not options.full_blocks,
+        prune_depth=options.prune,
+        processes=options.processes,
+        seed=options.seed,
+    )
+    try:
+        bootstrap = simulation.start()
+        start = time.time()
+        start_height = simulation.nodes[0].stats()["height"]
+        simulation.run_load(
+            options.rate, options.duration, options.block_interval
+        )
+        load_elapsed = time.time() - start
+        convergence = simulation.wait_converged(30.0)
+        committed = simulation.nodes[0].committed(start_height)
+
+        results = {
+            "parameters": vars(options),
+            "edges": simulation.edges,
+            "bootstrap": bootstrap,
+            "committed_transactions": committed,
+            "transactions_per_second": committed / load_elapsed,
+            "convergence_after_load": convergence,
+            "block_propagation": simulation.propagation(),
+        }
+        if options.partition:
+            results["partition"] = simulation.partition_and_heal(
+                options.partition, options.block_interval, options.rate
+            )
+        results["bandwidth"] = simulation.bandwidth(time.time() - start)
+    finally:
+        simulation.stop()
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import base64
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from block import Block
+from chain import Blockchain
+from key import Account, verify_signature
+
+
+@dataclass
+class Snapshot:
+    # the state of a chain at its head: the head header, the balances left
+    # by every block up to it and the pool. A node started from it keeps
+    # only that header below the blocks it receives next.
+    height: int
+    difficulty: int
+    block_reward: float
+    header: Dict[str, Any]
+    balances: Dict[str, float] = field(default_factory=dict)
+    tx_pool: List[Dict[str, Any]] = field(default_factory=list)
+    signer: Optional[str] = None
+    signature: Optional[str] = None
+
+    @classmethod
+    def take(cls, blockchain: Blockchain):
+        header = blockchain.head.to_dict()
+        header["transactions"] = []
+        return cls(
+            height=blockchain.head.index,
+            difficulty=blockchain.difficulty,
+            block_reward=blockchain.block_reward,
+            header=header,
+            balances=blockchain.balances(),
+            tx_pool=[
+                transaction.to_dict() for transaction in blockchain.tx_pool
+            ],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            height=int(data["height"]),
+            difficulty=int(data["difficulty"]),
+            block_reward=float(data["block_reward"]),
+            header=data["header"],
+            balances={
+                address: float(amount)
+                for address, amount in data["balances"].items()
+            },
+            tx_pool=data["tx_pool"],
+            signer=data["signer"],
+            signature=data["signature"],
+        )
+
+    def to_jsonfile(self, pathfile: str = "snapshot.json"):
+        with open(pathfile, "w") as file:
+            json.dump(self.to_dict(), file, sort_keys=True)
+
+    @classmethod
+    def from_jsonfile(cls, pathfile: str = "snapshot.json"):
+        with open(pathfile, "r") as file:
+            return cls.from_dict(json.load(file))
+
+    def message(self) -> str:
+        data = self.to_dict()
+        del data["signature"]
+        return json.dumps(data, sort_keys=True)
+
+    def sign(self, wallet: Account):
+        self.signer = wallet.to_address()
+        signature = wallet.sign(self.message())
+        self.signature = base64.b64encode(signature).decode("ascii")
+        return signature
+
+    def verify(self) -> bool:
+        if self.signature is None or self.signer is None:
+            logging.warning("Snapshot is not signed.")
+            return False
+        signature = base64.b64decode(self.signature.encode("ascii"))
+        if not verify_signature(signature.hex(), self.message(), self.signer):
+            logging.warning("Snapshot signature verification failed.")
+            return False
+        head = Block.from_dict(self.header)
+        if head.index != self.height or not head.header_is_valid(
+            self.difficulty
+        ):
+            logging.warning("Snapshot header is not valid.")
+            return False
+        return True
+
+    def to_blockchain(self) -> Blockchain:
+        # the head is kept as a pruned block: its transactions are part of
+        # the balances. The pool is left out, its transactions have to be
+        # verified one by one (see Node.import_snapshot).
+        return Blockchain(
+            difficulty=self.difficulty,
+            blocks=[Block.from_dict(self.header)],
+            block_reward=self.block_reward,
+            pruned_height=self.height + 1,
+            pruned_balances=dict(self.balances),
+        )
@@ -0,0 +1,58 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from transaction import Transaction
+
+
+def transaction_size(transaction: Transaction) -> int:
+    return len(json.dumps(transaction.to_dict(), sort_keys=True).encode())
+
+
+# priorities, from a transaction and its arrival sequence number: lower key
+# is picked first
+def by_arrival(transaction: Transaction, arrival: int) -> Any:
+    return arrival
+
+
+def by_amount(transaction: Transaction, arrival: int) -> Any:
+    return -transaction.amount, arrival
+
+
+@dataclass
+class BlockTemplateBuilder:
+    max_transactions: int = 1000
+    max_bytes: int = 1_000_000
+    priority: Callable[[Transaction, int], Any] = by_arrival
+
+    def select(
+        self,
+        transactions: Iterable[Transaction],
+        reserved: Sequence[Transaction] = (),
+        arrivals: Optional[Dict[Optional[str], int]] = None,
+    ) -> List[Transaction]:
+        # reserved transactions (e.g. the block reward) always go first
+        # and are counted in the budget. `arrivals` maps signatures to
+        # arrival sequence numbers, the order of `transactions` otherwise.
+        selected = list(reserved)
+        size = sum(map(transaction_size, selected))
+
+        keyed = []
+        for position, transaction in enumerate(transactions):
+            arrival = position
+            if arrivals is not None:
+                arrival = arrivals.get(transaction.signature, position)
+            keyed.append((self.priority(transaction, arrival), transaction))
+        keyed.sort(key=lambda entry: entry[0])
+
+        for _, transaction in keyed:
+            if len(selected) >= self.max_transactions:
+                break
+            tx_size = transaction_size(transaction)
+            if size + tx_size > self.max_bytes:
+                # a smaller transaction may still fit
+                continue
+            selected.append(transaction)
+            size += tx_size
+
+        return selected
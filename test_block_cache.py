@@ -0,0 +1,60 @@
+import json
+import time
+
+from block import Block
+from chain import Blockchain
+from key import BitcoinAccount
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def signed(receiver: str) -> Transaction:
+    transaction = Transaction(wallet.to_address(), receiver, 1.0, time.time())
+    transaction.sign(wallet)
+    return transaction
+
+
+def test_to_dict_returns_a_copy():
+    block = Block(1, "0" * 64, timestamp=time.time())
+    block.add_transaction(signed("a"))
+    data = block.to_dict()
+    data["nonce"] = 42
+    data["transactions"][0]["amount"] = 1000.0
+    data["transactions"].append({})
+
+    assert block.to_dict()["nonce"] == 0
+    assert block.to_dict()["transactions"] == [block.transactions[0].to_dict()]
+    assert block.to_json() == json.dumps(block.to_dict(), sort_keys=True)
+
+
+def test_changes_refresh_the_cache():
+    block = Block(
+        1, "0" * 64, timestamp=time.time(), miner=wallet.to_address()
+    )
+    empty = block.to_json()
+
+    block.add_transaction(signed("a"))
+    assert block.to_json() != empty
+    assert len(block.to_dict()["transactions"]) == 1
+
+    block.mine(1)
+    assert json.loads(block.to_json())["hashval"] == block.hashval
+    assert block.to_dict()["merkle_root"] == block.merkle_root
+
+    block.sign(wallet)
+    assert block.to_dict()["signature"] == block.signature
+    assert Block.from_dict(json.loads(block.to_json())).verify()
+
+
+def test_pruning_refreshes_the_cache():
+    blockchain = Blockchain.create(1, wallet)
+    for receiver in "ab":
+        blockchain.add_transaction(signed(receiver))
+        blockchain.mine_block(wallet)
+    block = blockchain.blocks[1]
+    assert json.loads(block.to_json())["transactions"]
+
+    blockchain.prune(1)
+    assert json.loads(block.to_json())["transactions"] == []
+    assert block.to_dict()["transactions"] == []
@@ -1,14 +1,17 @@
 import json
+import os
+import tempfile
+import time
 
 from chain import Blockchain
 from key import BitcoinAccount
+from transaction import Transaction
 
 wallet = BitcoinAccount()
 address = wallet.to_address()
 difficulty = 4
 
 blockchain = Blockchain(difficulty)
-blockchain.create_genesis_block()
 
 print("blockchain: ")
 print(blockchain.to_dict())
@@ -18,9 +21,11 @@ first_block = blockchain.head
 print("First block: ")
 print(first_block)
 
-blockchain.add_transaction(address, "colas", 10)
-blockchain.add_transaction(address, "salim", 30)
-blockchain.mine_block()
+for receiver, amount in [("colas", 10.0), ("salim", 30.0)]:
+    transaction = Transaction(address, receiver, amount, time.time())
+    transaction.sign(wallet)
+    blockchain.add_transaction(transaction)
+blockchain.mine_block(wallet)
 
 print("blockchain: ")
 print(json.dumps(blockchain.to_dict(), indent=2))
@@ -31,6 +36,22 @@ print(second_block)
 
 print(f"Validity: {blockchain.is_valid()}")
 
-blockchain.to_jsonfile()
-blockchain2 = Blockchain.from_jsonfile()
-print(f"Equality: {blockchain == blockchain2}")
\ No newline at end of file
+# holds the saved chain and its index, removed at the end
+directory = tempfile.TemporaryDirectory()
+pathfile = os.path.join(directory.name, "blockchain.json")
+blockchain.to_jsonfile(pathfile)
+blockchain2 = Blockchain.from_jsonfile(pathfile)
+print(f"Equality: {blockchain == blockchain2}")
+
+blockchain.enable_index()
+txid = second_block.transactions[1].txid
+print(f"Transaction position: {blockchain.transaction_position(txid)}")
+print(f"History of {address}: {len(blockchain.address_history(address))}")
+blockchain.to_jsonfile(pathfile)
+blockchain3 = Blockchain.from_jsonfile(pathfile)
+print(f"Index loaded: {blockchain3.indexer is not None}")
+blockchain3.disconnect_block()
+print(f"After disconnect: {blockchain3.transaction_position(txid)}")
+print(f"Pool after disconnect: {len(blockchain3.tx_pool)}")
+
+directory.cleanup()
@@ -0,0 +1,56 @@
+import time
+
+from chain import Blockchain
+from compact import CompactBlock
+from key import BitcoinAccount
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def mined_block(blockchain: Blockchain, count: int):
+    for i in range(count):
+        transaction = Transaction(
+            wallet.to_address(), f"r{i}", 1.0, time.time()
+        )
+        transaction.sign(wallet)
+        blockchain.add_transaction(transaction)
+    block = blockchain.block_template(wallet)
+    block.mine(blockchain.difficulty)
+    return block
+
+
+def test_reconstruct_from_the_pool():
+    blockchain = Blockchain(1)
+    block = mined_block(blockchain, 3)
+    compact = CompactBlock.from_dict(CompactBlock.from_block(block).to_dict())
+    transactions, missing = compact.reconstruct(blockchain.pool_by_txid())
+    assert missing == []
+    rebuilt = compact.to_block(transactions)
+    assert rebuilt.compute_hash() == block.hashval
+
+
+def test_reconstruct_reports_a_missing_transaction():
+    blockchain = Blockchain(1)
+    block = mined_block(blockchain, 3)
+    # the reward is prefilled, the second pool transaction never arrived
+    blockchain.remove_transactions([block.transactions[2]])
+    compact = CompactBlock.from_block(block)
+    transactions, missing = compact.reconstruct(blockchain.pool_by_txid())
+    assert missing == [2]
+    assert transactions[2] is None
+    assert transactions[0].sender == "NETWORK_ADMIN"
+
+    transactions[2] = block.transactions[2]
+    assert compact.to_block(transactions).compute_hash() == block.hashval
+
+
+def test_pool_txids_follow_the_pool():
+    blockchain = Blockchain(1)
+    block = mined_block(blockchain, 2)
+    assert set(blockchain.pool_by_txid()) == {
+        transaction.txid for transaction in block.transactions[1:]
+    }
+    blockchain.remove_transactions(block.transactions)
+    assert blockchain.pool_by_txid() == {}
+    assert blockchain.pool_txids == {}
@@ -0,0 +1,64 @@
+import time
+
+from chain import Blockchain
+from indexer import ChainIndex
+from key import BitcoinAccount
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def mine(blockchain: Blockchain, *receivers: str):
+    for receiver in receivers:
+        transaction = Transaction(
+            wallet.to_address(), receiver, 1.0, time.time()
+        )
+        transaction.sign(wallet)
+        blockchain.add_transaction(transaction)
+    return blockchain.mine_block(wallet)
+
+
+def same_index(first: ChainIndex, second: ChainIndex) -> bool:
+    return (
+        first.transactions == second.transactions
+        and first.addresses == second.addresses
+        and first.tip == second.tip
+    )
+
+
+def test_disconnect_undoes_connect():
+    blockchain = Blockchain(1)
+    mine(blockchain, "a")
+    blockchain.enable_index()
+    before = ChainIndex.build(blockchain.blocks)
+    mine(blockchain, "a", "b")
+    assert blockchain.address_history("b")[0].receiver == "b"
+
+    blockchain.disconnect_block()
+    assert same_index(blockchain.indexer, before)
+    assert blockchain.address_history("b") == []
+
+
+def test_take_index_across_a_reorg():
+    old = Blockchain(1)
+    mine(old, "a")
+    fork = Blockchain.from_dict(old.to_dict())
+    old.enable_index()
+    mine(old, "old")
+    for receiver in ["new1", "new2"]:
+        mine(fork, receiver)
+
+    assert fork.take_index(old)
+    assert old.indexer is None
+    assert same_index(fork.indexer, ChainIndex.build(fork.blocks))
+    assert fork.address_history("old") == []
+    assert fork.address_history("new2")[0].receiver == "new2"
+
+
+def test_take_index_refuses_a_stale_index():
+    old = Blockchain(1)
+    mine(old, "a")
+    fork = Blockchain.from_dict(old.to_dict())
+    # an index that did not follow the last block of its chain
+    old.indexer = ChainIndex.build(old.blocks[:1])
+    assert not fork.take_index(old)
@@ -0,0 +1,65 @@
+import time
+
+from block import Block, merkle_branch, merkle_root, root_from_branch
+from chain import Blockchain
+from key import BitcoinAccount
+from light import Header
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def mined_chain(length: int) -> Blockchain:
+    blockchain = Blockchain.create(1, wallet)
+    for i in range(length):
+        for j in range(3):
+            transaction = Transaction(
+                wallet.to_address(), f"r{i}-{j}", 1.0, time.time()
+            )
+            transaction.sign(wallet)
+            blockchain.add_transaction(transaction)
+        blockchain.mine_block(wallet)
+    return blockchain
+
+
+def test_forged_header_is_refused():
+    block = mined_chain(1).head
+    assert Header.from_block(block).is_valid(1)
+
+    forged = Header.from_block(block)
+    forged.merkle_root = merkle_root(["0" * 64])
+    assert not forged.is_valid(1)
+
+    forged = Header.from_block(block)
+    forged.timestamp += 1
+    assert not forged.is_valid(1)
+
+
+def test_branch_leads_to_the_root():
+    for count in range(1, 8):
+        txids = [f"{i:064x}" for i in range(count)]
+        root = merkle_root(txids)
+        for position, txid in enumerate(txids):
+            branch = merkle_branch(txids, position)
+            assert root_from_branch(txid, branch) == root
+            assert root_from_branch("f" * 64, branch) != root
+
+
+def test_changed_transaction_breaks_the_root():
+    block = Block.from_dict(mined_chain(1).head.to_dict())
+    assert block.hash_is_valid(1)
+    block.transactions[1].amount = 1000.0
+    assert not block.root_is_valid()
+    assert not block.hash_is_valid(1)
+
+
+def test_pruned_headers_are_re_hashed():
+    blockchain = mined_chain(4)
+    blockchain.prune(2)
+    pruned = Blockchain.from_dict(blockchain.to_dict()).blocks[1]
+    assert not pruned.transactions
+    assert pruned.header_is_valid(1)
+    assert Header.from_block(pruned).is_valid(1)
+
+    pruned.merkle_root = merkle_root(["0" * 64])
+    assert not pruned.header_is_valid(1)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from key import BitcoinAccount
+from pipeline import PipelineStage, TransactionPipeline
+from transaction import Transaction
+
+
+def test_full_stage_sheds():
+    release = threading.Event()
+    stage = PipelineStage("slow", lambda item: release.wait(), maxsize=2)
+    stage.start()
+    try:
+        # one item is taken by the worker, two fill the queue
+        accepted = [stage.put(i) for i in range(10)]
+        assert accepted.count(False) >= 7
+        assert stage.snapshot()["shed"] == accepted.count(False)
+    finally:
+        release.set()
+        stage.stop()
+
+
+def test_valid_transactions_are_admitted_once():
+    wallet = BitcoinAccount()
+    transaction = Transaction(wallet.to_address(), "a", 1.0, time.time())
+    transaction.sign(wallet)
+    forged = Transaction(wallet.to_address(), "b", 1.0, time.time())
+    forged.signature = transaction.signature
+
+    admitted = []
+    pipeline = TransactionPipeline(
+        lambda transaction, raw: admitted.append(transaction) or True,
+        verify_workers=1,
+    )
+    pipeline.start()
+    try:
+        for item in [transaction, transaction, forged]:
+            pipeline.submit({"transaction": item.to_dict()})
+        pipeline.submit({"malformed": True})
+    finally:
+        # the stages are stopped in order, each after its queue is drained
+        pipeline.stop()
+
+    assert admitted == [transaction]
+    assert pipeline.stats()["decode"]["rejected"] == 1
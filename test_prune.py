@@ -0,0 +1,69 @@
+import time
+
+from chain import Blockchain
+from key import BitcoinAccount
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def chain_of(length: int) -> Blockchain:
+    blockchain = Blockchain.create(1, wallet)
+    for i in range(length):
+        transaction = Transaction(
+            wallet.to_address(), f"r{i}", 1.0 + i, time.time()
+        )
+        transaction.sign(wallet)
+        blockchain.add_transaction(transaction)
+        blockchain.mine_block(wallet)
+    return blockchain
+
+
+def copy(blockchain: Blockchain) -> Blockchain:
+    return Blockchain.from_dict(blockchain.to_dict())
+
+
+def test_prune_keeps_the_balances():
+    blockchain = chain_of(5)
+    balances = blockchain.balances()
+    blockchain.prune(2)
+    assert blockchain.pruned_height == blockchain.head.index - 1
+    assert blockchain.balances() == balances
+    assert copy(blockchain).balances() == balances
+    assert all(
+        not block.transactions
+        for block in blockchain.blocks[: blockchain.pruned_height]
+    )
+
+
+def test_forged_pruned_balances_are_replaced():
+    full = chain_of(5)
+    balances = full.balances()
+    peer = copy(full)
+    peer.prune(2)
+    peer.pruned_balances = {"forger": 1_000_000.0}
+
+    trusted = copy(full)
+    trusted.prune(3)
+    assert peer.adopt_pruned_state(trusted)
+    assert peer.pruned_height == trusted.pruned_height
+    assert peer.balances() == balances
+
+
+def test_pruned_bodies_come_back_from_a_full_chain():
+    full = chain_of(4)
+    peer = copy(full)
+    peer.prune(1)
+    peer.pruned_balances = {"forger": 1_000_000.0}
+    assert peer.adopt_pruned_state(full)
+    assert peer.pruned_height == 0
+    assert peer.balances() == full.balances()
+    assert peer.is_valid()
+
+
+def test_pruned_state_of_another_chain_is_refused():
+    peer = chain_of(4)
+    peer.prune(1)
+    other = chain_of(4)
+    other.prune(1)
+    assert not peer.adopt_pruned_state(other)
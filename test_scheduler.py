@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import InboundScheduler
+
+
+def message(operation: str, **parameters) -> bytes:
+    # encoded like Node.publish does
+    data = {"operation": operation, "parameters": parameters}
+    return json.dumps(data).encode("utf-8")
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_blocks_come_first():
+    handled = []
+    scheduler = InboundScheduler(
+        lambda data: handled.append(json.loads(data)["operation"])
+    )
+    for operation in ["add_transaction", "other", "add_peer", "add_block"]:
+        scheduler.put(message(operation))
+    scheduler.start()
+    try:
+        wait_for(lambda: len(handled) == 4)
+    finally:
+        scheduler.stop()
+    assert handled == ["add_block", "add_peer", "add_transaction", "other"]
+
+
+def test_chain_messages_are_handed_off_one_at_a_time():
+    started, release = threading.Event(), threading.Event()
+    handled = []
+
+    def handle(data: bytes):
+        started.set()
+        release.wait()
+        handled.append(json.loads(data)["parameters"])
+
+    executor = ThreadPoolExecutor(1)
+    scheduler = InboundScheduler(handle, executors={"chain": executor})
+    scheduler.start()
+    try:
+        scheduler.put(message("add_peer", address="a", n=1))
+        assert started.wait(5.0)
+        for address, n in [("a", 2), ("b", 1), ("a", 3)]:
+            scheduler.put(message("add_peer", address=address, n=n))
+
+        chain = scheduler.snapshot()["chain"]
+        # the message in the executor and two queued, the second of "a"
+        # was replaced by the third
+        assert chain["depth"] == 3
+        assert chain["shed"] == 1
+
+        release.set()
+        wait_for(lambda: scheduler.snapshot()["chain"]["depth"] == 0)
+    finally:
+        release.set()
+        scheduler.stop()
+        executor.shutdown()
+    assert handled == [
+        {"address": "a", "n": 1},
+        {"address": "a", "n": 3},
+        {"address": "b", "n": 1},
+    ]
@@ -0,0 +1,62 @@
+import time
+
+from chain import Blockchain
+from key import BitcoinAccount
+from template import BlockTemplateBuilder, by_amount, transaction_size
+from transaction import Transaction
+
+wallet = BitcoinAccount()
+
+
+def signed(receiver: str, amount: float, timestamp: float) -> Transaction:
+    transaction = Transaction(wallet.to_address(), receiver, amount, timestamp)
+    transaction.sign(wallet)
+    return transaction
+
+
+def test_count_limit_includes_reserved():
+    reward = Transaction("NETWORK_ADMIN", "miner", 50.0, time.time())
+    pool = [signed(f"r{i}", 1.0, time.time()) for i in range(5)]
+    builder = BlockTemplateBuilder(max_transactions=3)
+    selected = builder.select(pool, reserved=[reward])
+    assert selected == [reward] + pool[:2]
+
+
+def test_byte_limit_skips_to_smaller_transactions():
+    small = signed("a", 1.0, time.time())
+    large = signed("a" * 500, 1.0, time.time())
+    smaller = signed("b", 1.0, time.time())
+    builder = BlockTemplateBuilder(
+        max_bytes=transaction_size(small) + transaction_size(smaller)
+    )
+    assert builder.select([small, large, smaller]) == [small, smaller]
+
+
+def test_backdated_transaction_keeps_its_arrival_rank():
+    blockchain = Blockchain(1)
+    first = signed("first", 1.0, time.time())
+    backdated = signed("backdated", 1.0, time.time() - 3600)
+    blockchain.add_transaction(first)
+    blockchain.add_transaction(backdated)
+    template = blockchain.block_template(wallet)
+    receivers = [transaction.receiver for transaction in template.transactions]
+    assert receivers[1:] == ["first", "backdated"]
+
+
+def test_by_amount_breaks_ties_by_arrival():
+    blockchain = Blockchain(1)
+    for receiver, amount in [("a", 1.0), ("b", 5.0), ("c", 1.0)]:
+        blockchain.add_transaction(signed(receiver, amount, time.time()))
+    template = blockchain.block_template(
+        wallet, BlockTemplateBuilder(priority=by_amount)
+    )
+    receivers = [transaction.receiver for transaction in template.transactions]
+    assert receivers[1:] == ["b", "a", "c"]
+
+
+def test_mined_transactions_leave_the_arrival_order():
+    blockchain = Blockchain(1)
+    transaction = signed("a", 1.0, time.time())
+    blockchain.add_transaction(transaction)
+    blockchain.mine_block(wallet)
+    assert transaction.signature not in blockchain.arrivals
@@ -6,6 +6,7 @@ import logging
 from typing import Any, Dict, Optional
 
 from key import Account, verify_signature
+from metrics import metrics
 
 
 @dataclass
@@ -28,6 +29,14 @@ class Transaction:
             hashlib.sha256(data.encode("utf-8")).digest(), "big"
         )
 
+    @property
+    def txid(self) -> str:
+        # tx_number depends on the block, it is not part of the id
+        data = self.to_dict()
+        del data["tx_number"]
+        message = json.dumps(data, sort_keys=True)
+        return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
 
@@ -38,26 +47,27 @@ class Transaction:
             receiver=data["receiver"],
             amount=float(data["amount"]),
             timestamp=float(data["timestamp"]),
-            tx_number=None
-            if data["tx_number"] is None
-            else int(data["tx_number"]),
+            tx_number=(
+                None if data["tx_number"] is None else int(data["tx_number"])
+            ),
             signature=data["signature"],
         )
 
-    def sign(self, wallet: Account):
+    def message(self) -> str:
+        # the signed part of the transaction
         data = self.to_dict()
         del data["signature"]
         del data["tx_number"]
-        message = json.dumps(data, sort_keys=True)
-        signature = wallet.sign(message)
+        return json.dumps(data, sort_keys=True)
+
+    def sign(self, wallet: Account):
+        signature = wallet.sign(self.message())
         self.signature = base64.b64encode(signature).decode("ascii")
         return signature
 
+    @metrics.timed("transaction.verify")
     def verify(self):
-        data = self.to_dict()
-        del data["signature"]
-        del data["tx_number"]
-        message = json.dumps(data, sort_keys=True)
+        message = self.message()
         if self.signature is None:
             logging.warning("Signature is None.")
             return False
@@ -0,0 +1,112 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Optional, Sequence
+
+from block import Block
+from chain import Blockchain
+
+
+def _check_blocks(
+    blocks: Sequence[Block], difficulty: int, verify_signatures: bool
+) -> Optional[int]:
+    # index of the first invalid block of the chunk
+    for block in blocks:
+        if not block.hash_is_valid(difficulty):
+            return block.index
+        # the genesis block of Blockchain() is not signed
+        if (
+            verify_signatures
+            and (block.index != 0 or block.signature is not None)
+            and not block.verify()
+        ):
+            return block.index
+    return None
+
+
+class ChainValidator:
+    # checks the links between the blocks in this process, then re-hashes
+    # and verifies the blocks by chunks over a process pool, stopping at the
+    # first invalid one
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 16):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        # started on the first chain long enough to need it
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def check_links(self, blockchain: Blockchain) -> bool:
+        previous: Optional[Block] = None
+        for block in blockchain.blocks:
+            if previous is None:
+                # a chain bootstrapped from a snapshot trusts its first block
+                linked = block.index != 0 or block.previous_hash == ""
+            else:
+                linked = (
+                    block.index == previous.index + 1
+                    and block.previous_hash == previous.hashval
+                    and block.timestamp >= previous.timestamp
+                )
+            if not linked or not block.header_is_valid(blockchain.difficulty):
+                logging.error(f"Block {block.index} is not linked.")
+                return False
+            previous = block
+        return True
+
+    def validate(
+        self, blockchain: Blockchain, verify_signatures: bool = True
+    ) -> bool:
+        if not self.check_links(blockchain):
+            return False
+
+        # pruned blocks lost the transactions their hash covers
+        blocks = [
+            block
+            for block in blockchain.blocks
+            if not blockchain.is_pruned(block)
+        ]
+        chunks: List[List[Block]] = [
+            blocks[i : i + self.chunk_size]
+            for i in range(0, len(blocks), self.chunk_size)
+        ]
+        if self.workers == 1 or len(chunks) <= 1:
+            invalid = (
+                _check_blocks(chunk, blockchain.difficulty, verify_signatures)
+                for chunk in chunks
+            )
+            return self._report(
+                next((i for i in invalid if i is not None), None)
+            )
+
+        if self._executor is None:
+            # the node runs many threads, a forked worker could inherit one
+            # of their locks held and hang on it
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        pending = {
+            self._executor.submit(
+                _check_blocks, chunk, blockchain.difficulty, verify_signatures
+            )
+            for chunk in chunks
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                invalid = future.result()
+                if invalid is not None:
+                    for future in pending:
+                        future.cancel()
+                    return self._report(invalid)
+        return True
+
+    @staticmethod
+    def _report(invalid: Optional[int]) -> bool:
+        if invalid is None:
+            return True
+        logging.error(f"Block {invalid} is not valid.")
+        return False